@@ -0,0 +1,316 @@
+"""
+asyncio interface to the printers (Python 3.7+).
+
+AsyncEpsonPrinter has the same command methods as EpsonPrinter, as coroutines:
+
+    printer = await AsyncEpsonPrinter.connect_tcp('192.168.1.50')
+    async with printer.job():
+        await printer.bold_on()
+        await printer.print_text("Total")
+    await printer.close()
+
+Commands are encoded synchronously with an EpsonPrinter writing to memory, then handed to an
+asynchronous transport. Network printers use asyncio streams, any other transport (USB, file)
+runs in a dedicated single thread executor so that blocking transfers never stall the loop.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from .codepages import CODE_PAGES, select_code_page
+from .epsonprinter import EpsonPrinter, COLUMN_MODE
+from .instrumentation import PrinterStats, timer
+from .profiles import get_profile
+from .transport import Transport, UsbTransport
+
+
+class AsyncTransport(object):
+    """ Base class of the asynchronous transports """
+
+    async def writev(self, buffers):
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+
+class ExecutorTransport(AsyncTransport):
+    """
+    Runs a blocking transport in a dedicated single thread executor. Transfers to the device are
+    serialized and never take a thread from the loop's default executor.
+    """
+
+    def __init__(self, transport, executor=None):
+        self.transport = transport
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+
+    async def writev(self, buffers):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.transport.writev, buffers)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.transport.close)
+        self.executor.shutdown(wait=False)
+
+
+class AsyncTcpTransport(AsyncTransport):
+    """ A network printer listening for raw ESC/POS on a TCP port, using asyncio streams """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port=9100):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def writev(self, buffers):
+        self.writer.writelines(buffers)
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+class _Recorder(Transport):
+    """ Collects the buffers written by an EpsonPrinter """
+
+    def __init__(self):
+        self.buffers = []
+
+    def writev(self, buffers):
+        self.buffers.extend(buffers)
+
+
+class _StreamAbandoned(BaseException):
+    """
+    Stops the encoding of a stream whose coroutine was cancelled. Not an Exception, so that the
+    EpsonPrinter writing to the queue does not count it as a transport error.
+    """
+
+
+class _QueueTransport(Transport):
+    """
+    Hands the buffers written by an EpsonPrinter in an executor thread to a coroutine of the loop, one
+    write at a time, then None once the encoding is over. The thread waits while the queue is full.
+    """
+
+    def __init__(self, queue, loop):
+        self.queue = queue
+        self.loop = loop
+        self.closed = False
+
+    def _put(self, item):
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def writev(self, buffers):
+        if self.closed:
+            raise _StreamAbandoned()
+        self._put(list(buffers))
+
+    def finish(self):
+        # Nobody reads the queue any more once the stream is abandoned
+        if not self.closed:
+            self._put(None)
+
+
+class AsyncPrintJob(object):
+    """ Asynchronous counterpart of PrintJob, see AsyncEpsonPrinter.job() """
+
+    def __init__(self, printer):
+        self.printer = printer
+        self.started = None
+
+    async def __aenter__(self):
+        if self.printer._job_depth == 0:
+            self.started = timer()
+        self.printer._job_depth += 1
+        return self.printer
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.printer._job_depth -= 1
+        if self.printer._job_depth == 0:
+            if exc_type is None:
+                size = sum(len(buf) for buf in self.printer._pending)
+                await self.printer.flush()
+                if self.started is not None:
+                    self.printer.stats.record_job(size, timer() - self.started)
+            else:
+                self.printer._pending = []
+
+
+class AsyncEpsonPrinter(object):
+    """ An Epson thermal printer driven from an asyncio event loop """
+
+    # Methods encoding images or reading files, run in the loop's default executor
+    OFFLOADED = ('print_image_from_file', 'print_image_from_buffer', 'print_job_file', 'print_text_image')
+
+    # Bands of print_image_stream encoded ahead of the writes
+    STREAM_BANDS = 4
+
+    def __init__(self, transport, encoding='cp437', name=None, profile=None):
+        """
+        @param transport : An AsyncTransport, or a blocking Transport which is then wrapped in an ExecutorTransport
+        @param encoding  : Encoding used to send unicode text
+        @param name      : Name of the printer in the log messages
+        @param profile   : PrinterProfile of the printer model or its name, see epson_printer.profiles
+        """
+        if isinstance(transport, Transport):
+            transport = ExecutorTransport(transport)
+        self.transport = transport
+        self.encoding = encoding
+        self.profile = get_profile(profile)
+        self.code_page = encoding if encoding in CODE_PAGES else None
+        self._pending = []
+        self._job_depth = 0
+        self._last_write = None
+        self.stats = PrinterStats(name)
+
+    @classmethod
+    async def connect_tcp(cls, host, port=9100, **kwargs):
+        return cls(await AsyncTcpTransport.connect(host, port), **kwargs)
+
+    @classmethod
+    def usb(cls, id_vendor, id_product, out_ep=0x01, buffer_size=None, **kwargs):
+        """
+        @param buffer_size : Maximum size of a single USB transfer, see EpsonPrinter
+        """
+        profile = get_profile(kwargs.get('profile'))
+        return cls(UsbTransport(id_vendor, id_product, out_ep, buffer_size or profile.max_transfer), **kwargs)
+
+    def _record(self, name, args, kwargs, code_page, recorder):
+        """
+        Encode a command for a printer showing code_page, run in the executor threads too
+        :return: the code page shown after it
+        """
+        printer = EpsonPrinter(transport=recorder, encoding=self.encoding, profile=self.profile)
+        printer.code_page = code_page
+        getattr(printer, name)(*args, **kwargs)
+        return printer.code_page
+
+    async def _call(self, name, args, kwargs):
+        # The code page shown by the printer is carried from one call to the next, and only updated on the loop
+        code_page = self.code_page
+        recorder = _Recorder()
+        if name in self.OFFLOADED:
+            loop = asyncio.get_running_loop()
+            end_page = await loop.run_in_executor(None, self._record, name, args, kwargs, code_page, recorder)
+        else:
+            end_page = self._record(name, args, kwargs, code_page, recorder)
+        buffers = recorder.buffers
+        if self.code_page != code_page:
+            # Another command switched the page while this one was encoded
+            buffers.insert(0, bytearray(select_code_page(code_page)))
+        self.code_page = end_page
+        await self._write(buffers)
+
+    def _record_stream(self, args, code_page, transport):
+        try:
+            # Images do not change the code page
+            self._record('print_image_stream', args, {}, code_page, transport)
+        except _StreamAbandoned:
+            pass
+        finally:
+            transport.finish()
+
+    async def _write(self, buffers):
+        self._pending.extend(buffers)
+        if self._job_depth == 0:
+            await self.flush()
+
+    async def print_image_stream(self, image, mode=COLUMN_MODE, band_height=24, dither=None, compact=False):
+        """
+        Print a PIL Image while it is being encoded, see EpsonPrinter.print_image_stream. The bands are
+        encoded in the loop's default executor and every one is sent as soon as it is ready, at most
+        STREAM_BANDS of them waiting for the printer.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.STREAM_BANDS)
+        transport = _QueueTransport(queue, loop)
+        encoding = loop.run_in_executor(None, self._record_stream, (image, mode, band_height, dither, compact),
+                                        self.code_page, transport)
+        try:
+            while True:
+                buffers = await queue.get()
+                if buffers is None:
+                    break
+                await self._write(buffers)
+        finally:
+            if not encoding.done():
+                # Stop the thread, which may be waiting for room in the queue
+                transport.closed = True
+                while not queue.empty():
+                    queue.get_nowait()
+            # When the stream is cancelled, an encoding error has nobody to be reported to
+            encoding.add_done_callback(_retrieve_exception)
+        await encoding
+
+    def job(self):
+        """
+        Buffer every command until the end of the block, like EpsonPrinter.job():
+
+            async with printer.job():
+                ...
+        """
+        return AsyncPrintJob(self)
+
+    async def flush(self):
+        """
+        Send the pending commands. Writes are chained so that they reach the device in order, and
+        a write that started is always completed: cancelling a flush never leaves a truncated
+        command on the wire.
+        """
+        buffers = self._pending
+        self._pending = []
+        if not buffers:
+            return
+        previous = self._last_write
+
+        async def write():
+            if previous is not None:
+                await asyncio.wait([previous])
+                if not previous.cancelled():
+                    # Mark the exception as retrieved, it was raised to the caller of the previous flush
+                    previous.exception()
+            size = sum(map(len, buffers))
+            start = timer()
+            try:
+                await self.transport.writev(buffers)
+            except Exception as e:
+                self.stats.record_error(e, size, timer() - start)
+                raise
+            self.stats.record_write(size, timer() - start)
+
+        self._last_write = asyncio.ensure_future(write())
+        await asyncio.shield(self._last_write)
+
+    def get_stats(self):
+        """ Snapshot of the counters and timings of the printer, see EpsonPrinter.get_stats() """
+        return self.stats.snapshot(getattr(self.transport, 'transport', None))
+
+    async def close(self):
+        if self._last_write is not None:
+            await asyncio.wait([self._last_write])
+        await self.transport.close()
+
+
+def _retrieve_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+
+def _command(name):
+    async def command(self, *args, **kwargs):
+        await self._call(name, args, kwargs)
+    functools.update_wrapper(command, getattr(EpsonPrinter, name))
+    return command
+
+
+for _name, _member in list(vars(EpsonPrinter).items()):
+    if (callable(_member) and not _name.startswith('_')
+            and _name not in ('write_this', 'job', 'close', 'query_status', 'read_asb', 'capture', 'replay')
+            and not hasattr(AsyncEpsonPrinter, _name)):
+        setattr(AsyncEpsonPrinter, _name, _command(_name))
+del _name, _member
@@ -0,0 +1,363 @@
+"""
+Benchmark suite of the encoding and transport hot paths.
+
+Every benchmark writes to an in-memory fake device and reports its best time, its throughput and
+the peak memory allocated while it runs. Results can be saved as JSON and compared with a previous
+run:
+
+    python -m epson_printer.benchmark --output before.json
+    ... change the code ...
+    python -m epson_printer.benchmark --output after.json --compare before.json
+"""
+from __future__ import division, print_function
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+import numpy as np
+from optparse import OptionParser
+from PIL import Image
+from . import __version__
+from .dithering import Ditherer, METHODS
+from .epsonprinter import EpsonPrinter, PrintableImage, COLUMN_MODE, RASTER_MODE
+from .glyphs import GlyphCache, TextRenderer
+from .template import compile_template
+from .transport import Transport
+
+MB = 1024 * 1024
+
+# Dependencies that sending text must not load
+HEAVY_MODULES = ('numpy', 'PIL', 'usb')
+
+IMPORT_SCRIPT = """
+import json, sys
+from timeit import default_timer as timer
+start = timer()
+from epson_printer.epsonprinter import EpsonPrinter
+from epson_printer.transport import MemoryTransport
+seconds = timer() - start
+printer = EpsonPrinter(transport=MemoryTransport())
+printer.print_text("Hello")
+printer.cut()
+print(json.dumps([seconds, [name for name in %r if name in sys.modules]]))
+"""
+
+BASELINE_SCRIPT = """
+from timeit import default_timer as timer
+start = timer()
+import %s
+print(timer() - start)
+"""
+
+
+class NullTransport(Transport):
+    """ Fake device counting what it receives """
+
+    def __init__(self):
+        self.bytes = 0
+        self.transfers = 0
+
+    def writev(self, buffers):
+        self.bytes += sum(len(buf) for buf in buffers)
+        self.transfers += 1
+
+
+def legacy_from_image(image):
+    """
+    Reference implementation of the original per-pixel encoder, kept to measure the speedup of
+    PrintableImage.from_image. Returns the payload as a list of ints.
+    """
+    (w, h) = image.size
+    if image.mode != '1':
+        image = image.convert('1')
+    pixels = np.array(list(image.getdata())).reshape(h, w)
+    extra_rows = int(math.ceil(h / 24)) * 24 - h
+    pixels = np.vstack((pixels, np.ones((extra_rows, w), dtype=bool)))
+    h += extra_rows
+    nb_stripes = h // 24
+    pixels = pixels.reshape(nb_stripes, 24, w).swapaxes(1, 2).reshape(-1, 8)
+    nh = int(w / 256)
+    nl = w % 256
+    data = []
+    for stripe in np.split(np.invert(np.packbits(pixels)), nb_stripes):
+        data.extend([27, 42, 33, nl, nh])
+        data.extend(stripe)
+        data.extend([27, 74, 48])
+    return data
+
+
+def random_image(width, height, seed=0):
+    """ A noisy mode '1' image, the worst case for the encoder """
+    rng = np.random.RandomState(seed)
+    pixels = (rng.randint(0, 2, size=(height, width)) * 255).astype(np.uint8)
+    return Image.fromarray(pixels, 'L').convert('1')
+
+
+def gradient_image(width, height):
+    """ A horizontal gray ramp, what photos look like to the dithering methods """
+    ramp = np.tile(np.linspace(0, 255, width), (height, 1)).astype(np.uint8)
+    return Image.fromarray(ramp, 'L')
+
+
+def best_of(func, repeat, number=1):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def peak_memory(func):
+    """ Peak memory allocated by func, in bytes """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, repeat, items=1, payload=0):
+    """
+    Time func and report its throughput.
+    :param items: number of items (images, commands, receipts) processed by a call
+    :param payload: number of bytes produced by a call
+    """
+    seconds = best_of(func, repeat)
+    return {
+        'seconds': seconds,
+        'items_per_s': items / seconds,
+        'mb_per_s': payload / seconds / MB,
+        'peak_bytes': peak_memory(func)}
+
+
+def import_time():
+    """
+    Import EpsonPrinter and send text in a fresh interpreter.
+    :return: the import time in seconds, and the HEAVY_MODULES that were loaded
+    """
+    return json.loads(_run_script(IMPORT_SCRIPT % (HEAVY_MODULES,)))
+
+
+def baseline_import_time(module='numpy'):
+    """
+    Import time in seconds of another module in a fresh interpreter, to compare import_time with on the
+    same machine
+    """
+    return float(_run_script(BASELINE_SCRIPT % module))
+
+
+def _run_script(script):
+    env = dict(os.environ)
+    # Time the import of compiled modules, not their compilation
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.check_output([sys.executable, '-c', script], cwd=root, env=env).decode('ascii')
+
+
+def bench_import(repeat):
+    seconds = min(import_time()[0] for _ in range(repeat + 1))
+    return {'import/epsonprinter': {'seconds': seconds, 'items_per_s': 1 / seconds, 'mb_per_s': 0., 'peak_bytes': 0}}
+
+
+def bench_from_image(sizes, repeat):
+    results = {}
+    for (w, h) in sizes:
+        image = random_image(w, h)
+        for mode in (COLUMN_MODE, RASTER_MODE):
+            size = PrintableImage.from_image(image, mode).size
+            results['from_image/%s/%dx%d' % (mode, w, h)] = measure(
+                lambda: PrintableImage.from_image(image, mode), repeat, payload=size)
+        if h <= 1000:
+            size = len(legacy_from_image(image))
+            results['from_image/legacy/%dx%d' % (w, h)] = measure(
+                lambda: legacy_from_image(image), repeat, payload=size)
+    return results
+
+
+def bench_dithering(sizes, repeat):
+    results = {}
+    for (w, h) in sizes:
+        image = gradient_image(w, h)
+        results['dithering/pil/%dx%d' % (w, h)] = measure(lambda: image.convert('1'), repeat, payload=w * h)
+        for method in sorted(METHODS):
+            ditherer = Ditherer(method)
+            results['dithering/%s/%dx%d' % (method, w, h)] = measure(
+                lambda: ditherer(image), repeat, payload=w * h)
+    return results
+
+
+def bench_print_images(counts, repeat):
+    results = {}
+    # Two stripes: 500 of them still fit in the 65535 dots of a page mode area
+    image = PrintableImage.from_image(random_image(512, 48))
+    for count in counts:
+        images = [image] * count
+
+        def print_images():
+            EpsonPrinter(transport=NullTransport()).print_images(*images)
+
+        results['print_images/%d' % count] = measure(print_images, repeat, items=count, payload=image.size * count)
+    return results
+
+
+def bench_write_bytes(count, repeat):
+    commands = [[27, 69, 1], [27, 100, 1], [29, 33, 17], [27, 97, 1], [29, 40, 75, 2, 0, 50, 3]]
+    size = sum(len(command) for command in commands) * count
+
+    def write_bytes():
+        printer = EpsonPrinter(transport=NullTransport())
+        for _ in range(count):
+            for command in commands:
+                printer.write_bytes(command)
+
+    return {'write_bytes/%d' % (count * len(commands)): measure(
+        write_bytes, repeat, items=count * len(commands), payload=size)}
+
+
+def print_receipt(printer, logo):
+    """ The commands of the test page """
+    with printer.job():
+        printer.print_text("Hello, how's it going?")
+        printer.linefeed()
+        printer.print_text("Part of this")
+        printer.bold_on()
+        printer.print_text(" line is bold")
+        printer.bold_off()
+        printer.linefeed()
+        printer.underline_on()
+        printer.print_text("Underlined")
+        printer.underline_off()
+        printer.linefeed()
+        printer.right_justified()
+        printer.print_text("Right justified")
+        printer.linefeed()
+        printer.center()
+        printer.print_text("Center justified")
+        printer.linefeed()
+        printer.left_justified()
+        printer.print_text("Left justified")
+        printer.linefeed()
+        printer.set_text_size(1, 1)
+        printer.print_text("Double size text")
+        printer.set_text_size(0, 0)
+        printer.linefeed()
+        printer.print_text("Following is a bitmap")
+        printer.linefeed()
+        printer.print_image(logo)
+        printer.linefeed()
+        printer.print_text("Feeding paper 10 lines before cutting")
+        printer.linefeed(10)
+        printer.cut()
+
+
+def bench_receipt(count, repeat):
+    # The test page logo when run from the repository root
+    logo = PrintableImage.from_image(Image.open('logo.png') if os.path.exists('logo.png') else random_image(200, 209))
+    device = NullTransport()
+    print_receipt(EpsonPrinter(transport=device), logo)
+
+    def receipts():
+        printer = EpsonPrinter(transport=NullTransport())
+        for _ in range(count):
+            print_receipt(printer, logo)
+
+    return {'receipt/%d' % count: measure(receipts, repeat, items=count, payload=device.bytes * count)}
+
+
+def bench_receipt_template(count, repeat):
+    """ The test page compiled as a template with a field for its first line """
+    logo = PrintableImage.from_image(Image.open('logo.png') if os.path.exists('logo.png') else random_image(200, 209))
+
+    def layout(receipt):
+        receipt.field('header')
+        receipt.linefeed()
+        print_receipt(receipt, logo)
+
+    template = compile_template(layout)
+    size = sum(len(buf) for buf in template.render(header="Receipt"))
+
+    def receipts():
+        printer = EpsonPrinter(transport=NullTransport())
+        for _ in range(count):
+            printer.print_template(template, header="Receipt")
+
+    return {'receipt_template/%d' % count: measure(receipts, repeat, items=count, payload=size * count)}
+
+
+def bench_text_image(lines, repeat):
+    """ Lines of text rendered as bit images, the glyph cache being warm """
+    text = u"\n".join([u"Caf\xe9 cr\xe8me  2 x 3.50  \u20ac7.00"] * lines)
+    renderer = TextRenderer(cache=GlyphCache())
+    renderer.render(text)
+    return {'text_image/%d' % lines: measure(lambda: renderer.render(text), repeat, items=len(text))}
+
+
+def run_suite(repeat=3, quick=False):
+    """
+    Run all the benchmarks.
+    :param quick: smaller workloads, to check that the suite runs
+    :return: a dict with the environment in 'meta' and the results by benchmark name in 'results'
+    """
+    if quick:
+        image_sizes, dithering_sizes, counts, commands, receipts = [(200, 209)], [(64, 64)], [2], 10, 2
+    else:
+        image_sizes = [(200, 209), (512, 1000), (512, 4000)]
+        dithering_sizes = [(512, 1000), (512, 4000)]
+        counts, commands, receipts = [10, 100, 500], 10000, 100
+    results = {}
+    results.update(bench_import(repeat))
+    results.update(bench_from_image(image_sizes, repeat))
+    results.update(bench_dithering(dithering_sizes, repeat))
+    results.update(bench_print_images(counts, repeat))
+    results.update(bench_write_bytes(commands, repeat))
+    results.update(bench_receipt(receipts, repeat))
+    results.update(bench_receipt_template(receipts, repeat))
+    results.update(bench_text_image(receipts, repeat))
+    return {
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform()},
+        'results': results}
+
+
+def format_results(suite, baseline=None):
+    lines = ["%-36s %12s %12s %10s %12s" % ("benchmark", "time (ms)", "items/s", "MB/s", "peak (KB)")]
+    if baseline is not None:
+        lines[0] += " %10s" % "vs base"
+    for name in sorted(suite['results']):
+        r = suite['results'][name]
+        line = "%-36s %12.3f %12.1f %10.2f %12.1f" % (
+            name, r['seconds'] * 1000, r['items_per_s'], r['mb_per_s'], r['peak_bytes'] / 1024)
+        if baseline is not None:
+            base = baseline['results'].get(name)
+            # Above 1 means faster than the baseline
+            line += " %9.2fx" % (base['seconds'] / r['seconds']) if base else " %10s" % "-"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser()
+    parser.add_option("-r", "--repeat", action="store", type="int", dest="repeat", default=3,
+                      help="Number of timing runs, the best one is reported")
+    parser.add_option("-o", "--output", action="store", type="string", dest="output",
+                      help="Save the results as JSON")
+    parser.add_option("-c", "--compare", action="store", type="string", dest="compare",
+                      help="JSON results of a previous run to compare with")
+    parser.add_option("-q", "--quick", action="store_true", dest="quick", default=False,
+                      help="Small workloads only")
+    options, args = parser.parse_args()
+
+    suite = run_suite(options.repeat, options.quick)
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+    print(format_results(suite, baseline))
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(suite, f, indent=2, sort_keys=True)
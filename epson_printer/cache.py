@@ -0,0 +1,160 @@
+"""
+Cache of encoded images, keyed by the content of the source image and the encoding parameters.
+
+    cache = ImageCache(max_bytes=8 * 1024 * 1024, directory='/var/cache/epson')
+    printer = EpsonPrinter(0x04b8, 0x0e03, image_cache=cache)
+    printer.print_image_from_file('logo.png')  # encoded once, then served from the cache
+
+Entries live in an in-process LRU bounded by the size of their payloads. When a directory is given,
+they are also written to disk so that they survive restarts.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from .epsonprinter import PrintableImage
+from .profiles import PrinterProfile
+
+# Bump when the encoders change their output, so that stale disk entries are not used
+CACHE_VERSION = 2
+
+
+class ImageCache(object):
+    """ LRU cache of PrintableImage instances with an optional disk tier """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, directory=None):
+        """
+        @param max_bytes : Maximum total payload size of the entries kept in memory
+        @param directory : Directory of the disk tier, no disk tier if None
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(source, **params):
+        """
+        Key of an encoded image, None if it cannot be cached (see _param)
+        :param source: content of the source image file
+        :param params: encoding parameters (rotation, mode, ...)
+        """
+        params = [(name, _param(value)) for name, value in sorted(params.items())]
+        if any(value is _UNCACHEABLE for _, value in params):
+            return None
+        digest = hashlib.sha256(source)
+        digest.update(repr((CACHE_VERSION, params)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """ A copy of the cached PrintableImage, None if there is none """
+        with self._lock:
+            printable_image = self._entries.get(key)
+            if printable_image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return printable_image.copy()
+        printable_image = self._read(key)
+        with self._lock:
+            if printable_image is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, printable_image)
+            return printable_image.copy()
+
+    def put(self, key, printable_image):
+        with self._lock:
+            self._store(key, printable_image)
+        self._write(key, printable_image)
+
+    def get_or_encode(self, source, encode, **params):
+        """
+        Return the cached image for source and params, or call encode() and cache its result. Images whose
+        params cannot be cached, see key, are encoded on every call
+        """
+        key = self.key(source, **params)
+        if key is None:
+            return encode()
+        printable_image = self.get(key)
+        if printable_image is None:
+            printable_image = encode()
+            self.put(key, printable_image)
+        return printable_image
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._bytes}
+
+    def clear(self):
+        """ Empty the memory tier """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key, printable_image):
+        # Entries are copies, the images handed in and out may be appended to
+        printable_image = printable_image.copy()
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key).size
+        self._entries[key] = printable_image
+        self._bytes += printable_image.size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _read(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                mode, height, data, width = pickle.load(f)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        return PrintableImage(data, height, mode, width)
+
+    def _write(self, key, printable_image):
+        if self.directory is None:
+            return
+        fd, path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((printable_image.mode, printable_image.height, printable_image.data, printable_image.width),
+                        f, pickle.HIGHEST_PROTOCOL)
+        # Readers never see a partially written entry
+        os.replace(path, self._path(key))
+
+
+_UNCACHEABLE = object()
+
+
+def _param(value):
+    """
+    Representation of an encoding parameter that is the same in every process. Profiles are represented
+    by what changes the encoded images, functions by their qualified name. Other callables (lambdas,
+    nested functions, partials...) have none and are not cached.
+    """
+    if isinstance(value, PrinterProfile):
+        return ('profile', value.width, value.density)
+    if callable(value):
+        module = getattr(value, '__module__', None)
+        qualname = getattr(value, '__qualname__', None)
+        if not module or not qualname or '<' in qualname:
+            return _UNCACHEABLE
+        return ('function', module, qualname)
+    return value
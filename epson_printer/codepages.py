@@ -0,0 +1,155 @@
+"""
+Text encoding over the ESC/POS code pages.
+
+    encoder = TextEncoder()
+    data, code_page = encoder.encode(u"Caf\xe9 5€, Ł\xf3dź", 'cp437')
+
+The printer shows one code page at a time, selected with ESC t. Characters are looked up in translation
+tables built once per code page. The current page is kept as long as it has the characters, and when
+it does not, the encoder switches with ESC t to the page covering the longest run of the following
+text. Characters no page has are drawn by the printer as small ESC * bit images, rendered once and
+cached, so that a multilingual receipt is still a few hundred bytes of text.
+"""
+import unicodedata
+from functools import lru_cache
+
+ESC = 27
+
+# ESC t numbers of the code pages, by Python codec name. katakana is the JIS X 0201 page of the printers
+CODE_PAGES = {
+    'cp437': 0,
+    'katakana': 1,
+    'cp850': 2,
+    'cp860': 3,
+    'cp863': 4,
+    'cp865': 5,
+    'cp857': 13,
+    'cp737': 14,
+    'cp1252': 16,
+    'cp866': 17,
+    'cp852': 18,
+    'cp858': 19,
+    'cp1250': 45,
+    'cp1251': 46,
+    'cp1253': 47,
+    'cp1254': 48,
+    'cp1257': 51,
+}
+
+# Code pages tried by the encoder, the first ones being preferred when several pages fit
+DEFAULT_CODE_PAGES = ('cp437', 'cp850', 'cp858', 'cp1252', 'cp852', 'cp1250', 'cp857', 'cp866', 'cp1251', 'cp737',
+                      'cp1253', 'cp1254', 'cp1257', 'katakana')
+
+# Number of characters whose bit images are kept
+GLYPH_CACHE_SIZE = 1024
+
+# Height of the bit images of the characters, the one of the ESC * 24-dot stripes
+GLYPH_HEIGHT = 24
+
+
+def select_code_page(name):
+    return [
+        ESC,
+        116,  # t
+        CODE_PAGES[name]]
+
+
+class CodePage(object):
+    """ A code page of the printer and its translation table from characters to bytes 0x80 to 0xff """
+
+    __slots__ = ('name', 'number', 'table')
+
+    def __init__(self, name, number, table):
+        self.name = name
+        self.number = number
+        self.table = table
+
+
+@lru_cache(maxsize=None)
+def get_code_page(name):
+    """ The CodePage of a name of CODE_PAGES, its table is built on the first call """
+    try:
+        number = CODE_PAGES[name]
+    except KeyError:
+        raise ValueError("Unknown code page: %s" % name)
+    table = {}
+    if name == 'katakana':
+        # Half width katakana, also written for their full width forms
+        for byte in range(0xa1, 0xe0):
+            char = chr(0xff61 + byte - 0xa1)
+            table[char] = byte
+            full_width = unicodedata.normalize('NFKC', char)
+            if len(full_width) == 1:
+                table.setdefault(full_width, byte)
+    else:
+        for byte in range(0x80, 0x100):
+            char = bytes([byte]).decode(name, 'ignore')
+            if char:
+                table.setdefault(char, byte)
+    return CodePage(name, number, table)
+
+
+class TextEncoder(object):
+    """ Encodes text over several code pages, see the module documentation """
+
+    def __init__(self, code_pages=DEFAULT_CODE_PAGES, fallback=True, font=None, font_size=18):
+        """
+        @param code_pages : Names of the code pages the printer supports, by order of preference
+        @param fallback   : Draw the characters of no code page as bit images, written as '?' if False
+        @param font       : Path of the TrueType font drawing them, PIL's default font if None
+        @param font_size  : Size of that font in pixels, at most GLYPH_HEIGHT
+        """
+        self.code_pages = [get_code_page(name) for name in code_pages]
+        self.fallback = fallback
+        self.font = font
+        self.font_size = font_size
+
+    def encode(self, text, code_page='cp437'):
+        """
+        Encode text for a printer showing code_page
+        :return: (bytes, name of the code page shown after them)
+        """
+        text = unicodedata.normalize('NFC', text)
+        if text.isascii():
+            return text.encode('ascii'), code_page
+        current = get_code_page(code_page)
+        data = bytearray()
+        for index, char in enumerate(text):
+            if char < u'\x80':
+                data.append(ord(char))
+                continue
+            byte = current.table.get(char)
+            if byte is None:
+                candidates = [page for page in self.code_pages if char in page.table]
+                if not candidates:
+                    data += glyph_bitmap(char, self.font, self.font_size) if self.fallback else b'?'
+                    continue
+                # max keeps the first, preferred, page of the ones covering the longest run
+                current = max(candidates, key=lambda page: _run_length(text, index, page))
+                data += bytearray(select_code_page(current.name))
+                byte = current.table[char]
+            data.append(byte)
+        return bytes(data), current.name
+
+
+def _run_length(text, start, code_page):
+    """ Number of characters of text from start that code_page can show """
+    table = code_page.table
+    for length, char in enumerate(text[start:]):
+        if char >= u'\x80' and char not in table:
+            return length
+    return len(text) - start
+
+
+@lru_cache(maxsize=GLYPH_CACHE_SIZE)
+def glyph_bitmap(char, font=None, size=18):
+    """
+    ESC * command drawing a character as a 24-dot double density bit image, printed within the line
+    like the characters of the printer fonts
+    :param font: path of a TrueType font, PIL's default font if None
+    :param size: size of the font in pixels
+    """
+    from .glyphs import render_glyph
+    columns = render_glyph(char, font, size, GLYPH_HEIGHT)[0]
+    width = len(columns)
+    return bytes(bytearray([ESC, 42, 33, width % 256, width // 256])) + columns.tobytes()
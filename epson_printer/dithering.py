@@ -0,0 +1,146 @@
+"""
+Conversion of grayscale images to the black and white dots of a thermal printer.
+
+    printer.print_image_from_file('qr.png', dither='threshold')
+    printer.print_image_from_file('photo.jpg', dither=Ditherer('atkinson', gamma=1.4, contrast=1.2))
+
+Every method works on whole NumPy arrays. Plain threshold and ordered (Bayer) dithering are a few
+array operations and suit text, line art and QR codes. Error diffusion (Floyd-Steinberg,
+Atkinson) gives better photos: pixels are processed along anti-diagonal wavefronts, every pixel
+of a wavefront being independent from the others, so that each step is a single vectorized update.
+"""
+from __future__ import division
+import numpy as np
+from PIL import Image
+
+THRESHOLD = 'threshold'
+BAYER = 'bayer'
+FLOYD_STEINBERG = 'floyd-steinberg'
+ATKINSON = 'atkinson'
+
+# Error diffusion kernels as (dy, dx, weight)
+FLOYD_STEINBERG_KERNEL = [
+    (0, 1, 7 / 16),
+    (1, -1, 3 / 16),
+    (1, 0, 5 / 16),
+    (1, 1, 1 / 16)]
+ATKINSON_KERNEL = [
+    (0, 1, 1 / 8),
+    (0, 2, 1 / 8),
+    (1, -1, 1 / 8),
+    (1, 0, 1 / 8),
+    (1, 1, 1 / 8),
+    (2, 0, 1 / 8)]
+
+
+def adjust(gray, gamma=1.0, contrast=1.0):
+    """
+    Apply a contrast factor around mid gray, then a gamma curve, to an array of gray levels (0-255).
+    Thermal paper darkens mid tones: a gamma above 1 lightens them.
+    """
+    levels = gray / 255.
+    if contrast != 1.0:
+        levels = np.clip((levels - 0.5) * contrast + 0.5, 0., 1.)
+    if gamma != 1.0:
+        levels = levels ** gamma
+    return levels * 255.
+
+
+def threshold(gray, level=128):
+    """ White where the gray level is at least level """
+    return gray >= level
+
+
+def bayer_matrix(size):
+    """ Ordered dithering matrix of size x size, size being a power of 2, with values in [0, 1) """
+    matrix = np.zeros((1, 1))
+    while matrix.shape[0] < size:
+        matrix = np.block([
+            [4 * matrix, 4 * matrix + 2],
+            [4 * matrix + 3, 4 * matrix + 1]])
+    return (matrix + 0.5) / matrix.size
+
+
+def bayer(gray, size=4):
+    """ Ordered dithering with a Bayer matrix tiled over the image """
+    (h, w) = gray.shape
+    matrix = bayer_matrix(size) * 255.
+    thresholds = np.tile(matrix, (int(np.ceil(h / size)), int(np.ceil(w / size))))[:h, :w]
+    return gray >= thresholds
+
+
+def diffuse(gray, kernel, level=128):
+    """
+    Error diffusion dithering with a kernel of (dy, dx, weight) offsets, dy >= 0 and dx > 0 when dy == 0.
+    Pixel (y, x) belongs to wavefront 2y + x: with such kernels, it only receives errors from earlier
+    wavefronts, so every wavefront is quantized in one step.
+    """
+    (h, w) = gray.shape
+    pad_y = max(dy for dy, _, _ in kernel)
+    pad_x = max(abs(dx) for _, dx, _ in kernel)
+    stride = w + 2 * pad_x
+    levels = np.zeros((h + pad_y, stride), dtype=np.float64)
+    levels[:h, pad_x:pad_x + w] = gray
+    levels = levels.ravel()
+    white = np.zeros((h + pad_y, stride), dtype=bool).ravel()
+    offsets = [(dy * stride + dx, weight) for dy, dx, weight in kernel]
+    rows = np.arange(h)
+    for t in range(2 * (h - 1) + w):
+        ys = rows[max(0, (t - w + 2) // 2):min(h - 1, t // 2) + 1]
+        # Flat indices of the pixels of the wavefront
+        pixels = ys * (stride - 2) + (t + pad_x)
+        values = levels[pixels]
+        dots = values >= level
+        white[pixels] = dots
+        error = values - 255. * dots
+        for offset, weight in offsets:
+            levels[pixels + offset] += error * weight
+    return white.reshape(h + pad_y, stride)[:h, pad_x:pad_x + w]
+
+
+def floyd_steinberg(gray, level=128):
+    return diffuse(gray, FLOYD_STEINBERG_KERNEL, level)
+
+
+def atkinson(gray, level=128):
+    return diffuse(gray, ATKINSON_KERNEL, level)
+
+
+METHODS = {
+    THRESHOLD: threshold,
+    BAYER: bayer,
+    FLOYD_STEINBERG: floyd_steinberg,
+    ATKINSON: atkinson}
+
+
+class Ditherer(object):
+    """
+    Converts a PIL image to a mode '1' image with one of the METHODS, after gamma and contrast adjustment.
+    Instances can be given as the dither argument of the image methods of EpsonPrinter and PrintableImage.
+    """
+
+    def __init__(self, method=FLOYD_STEINBERG, gamma=1.0, contrast=1.0):
+        if method not in METHODS:
+            raise ValueError("Unknown dithering method: %s" % method)
+        self.method = method
+        self.gamma = gamma
+        self.contrast = contrast
+
+    def __call__(self, image):
+        gray = np.asarray(image.convert('L'))
+        if self.gamma != 1.0 or self.contrast != 1.0:
+            gray = adjust(gray, self.gamma, self.contrast)
+        return Image.fromarray(np.ascontiguousarray(METHODS[self.method](gray)))
+
+    def __repr__(self):
+        # Stable, it is part of the image cache keys
+        return "Ditherer(%r, gamma=%r, contrast=%r)" % (self.method, self.gamma, self.contrast)
+
+
+def get_ditherer(dither):
+    """ A callable converting PIL images to mode '1', from a method name, a callable or None (PIL conversion) """
+    if dither is None:
+        return lambda image: image.convert('1')
+    if callable(dither):
+        return dither
+    return Ditherer(dither)
@@ -1,13 +1,27 @@
+"""
+ESC/POS commands and the EpsonPrinter sending them.
+
+NumPy and PIL are only imported by the image functions, and pyusb when a USB printer is opened, so
+that sending text to a network printer does not pay for loading them.
+"""
 from __future__ import division
 import math
 import io
-import base64
-import numpy as np
-import usb.core
+import binascii
+import mmap
+import os
+import struct
+from collections import namedtuple
+from contextlib import contextmanager
 from functools import wraps
-from PIL import Image
+from .codepages import TextEncoder, CODE_PAGES, select_code_page
+from .instrumentation import PrinterStats, record_encode, timer
+from .profiles import get_profile, DOUBLE_DENSITY, PAGE_MODE, RASTER, GRAPHICS, BARCODES, CODES_2D, STATUS
+from .status import PrinterStatus, enable_asb, ASB_ONLINE, ASB_ERROR, ASB_PAPER
+from .transport import UsbTransport, FileTransport, TeeTransport
 
 ESC = 27
+FS = 28
 GS = 29
 FULL_PAPER_CUT = [
     GS,
@@ -42,6 +56,59 @@ RIGHT_JUSTIFIED = [
     2]
 
 
+# Image encoding modes
+COLUMN_MODE = 'column'  # 24-dot double density ESC * stripes, printed in page mode
+RASTER_MODE = 'raster'  # GS v 0 raster bit image blocks
+
+# Maximum number of rows of a GS v 0 block
+MAX_RASTER_BAND = 2303
+
+# Size of the base64 text decoded at once by print_image_from_buffer
+BASE64_CHUNK_SIZE = 64 * 1024
+
+# Bytes that are not base64 characters, discarded by b64decode
+_BASE64_IGNORED = bytes(bytearray(byte for byte in range(256) if byte not in bytearray(
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')))
+
+# Size of the writes of EpsonPrinter.replay
+REPLAY_CHUNK_SIZE = 1024 * 1024
+
+# Job files (.escpos) hold an encoded PrintableImage behind a header: magic, format version, mode,
+# width in dots, height, payload size, SHA-256 of the source image and SHA-256 of the encoding parameters,
+# all little endian
+JOB_FILE_MAGIC = b'ESCP'
+JOB_FILE_VERSION = 2
+JOB_FILE_HEADER = struct.Struct('<4sBBHII32s32s')
+JOB_FILE_MODES = (COLUMN_MODE, RASTER_MODE)
+
+JobHeader = namedtuple('JobHeader', ['version', 'mode', 'width', 'height', 'size', 'source_hash', 'params_hash'])
+
+# GS k symbologies, with the length of their data (n) sent before it
+BARCODE_SYMBOLOGIES = {
+    'UPC-A': 65,
+    'UPC-E': 66,
+    'EAN13': 67,
+    'EAN8': 68,
+    'CODE39': 69,
+    'ITF': 70,
+    'CODABAR': 71,
+    'CODE93': 72,
+    'CODE128': 73}
+
+# Positions of the human readable interpretation (HRI) of barcodes
+HRI_NONE = 0
+HRI_ABOVE = 1
+HRI_BELOW = 2
+HRI_BOTH = 3
+
+# QR code error correction levels, restoring about 7%, 15%, 25% and 30% of the symbol
+QR_ERROR_CORRECTION = {
+    'L': 48,
+    'M': 49,
+    'Q': 50,
+    'H': 51}
+
+
 def linefeed(lines=1):
     return [
         ESC,  # ESC
@@ -88,69 +155,431 @@ def set_print_speed(speed):
     return byte_array
 
 
-class PrintableImage:
+def barcode(data, symbology='CODE128', height=162, module_width=3, hri=HRI_BELOW, hri_font=0):
+    """
+    GS k barcode, preceded by its height, width and HRI settings
+    :param data: the ASCII characters to encode. CODE128 data without a code set selection ({A, {B or {C)
+                 is encoded with code set B
+    :param symbology: one of BARCODE_SYMBOLOGIES
+    :param height: height in dots, 1 to 255
+    :param module_width: width of the narrowest bar in dots, 2 to 6
+    :param hri: position of the human readable text, HRI_NONE, HRI_ABOVE, HRI_BELOW or HRI_BOTH
+    :param hri_font: 0 for font A, 1 for font B
+    """
+    if symbology not in BARCODE_SYMBOLOGIES:
+        raise ValueError("Unknown barcode symbology: %s" % symbology)
+    if not 1 <= height <= 255:
+        raise ValueError("Barcode height should be between 1 and 255 dots")
+    if not 2 <= module_width <= 6:
+        raise ValueError("Barcode module width should be between 2 and 6 dots")
+    if hri not in (HRI_NONE, HRI_ABOVE, HRI_BELOW, HRI_BOTH):
+        raise ValueError("Unknown HRI position: %s" % hri)
+    if not isinstance(data, (bytes, bytearray)):
+        data = data.encode('ascii')
+    if symbology == 'CODE128' and not data.startswith(b'{'):
+        data = b'{B' + data
+    if not 1 <= len(data) <= 255:
+        raise ValueError("Barcode data should be 1 to 255 characters long")
+    byte_array = bytearray([
+        GS,
+        104,  # h
+        height,
+        GS,
+        119,  # w
+        module_width,
+        GS,
+        72,   # H
+        hri,
+        GS,
+        102,  # f
+        hri_font,
+        GS,
+        107,  # k
+        BARCODE_SYMBOLOGIES[symbology],
+        len(data)])
+    return byte_array + data
+
+
+def _symbol_command(cn, fn, params):
+    """ GS ( k function fn of the 2D symbol cn (48 for PDF417, 49 for QR code) """
+    size = len(params) + 2
+    return bytearray([
+        GS,
+        40,   # (
+        107,  # k
+        size % 256,
+        int(size / 256),
+        cn,
+        fn]) + params
+
+
+def _symbol_data(data):
+    if not isinstance(data, (bytes, bytearray)):
+        data = data.encode('utf-8')
+    if not 1 <= len(data) <= 0xffff - 3:
+        raise ValueError("Symbol data should be 1 to 65532 bytes long")
+    return data
+
+
+def qr_code(data, module_size=3, error_correction='M', model=2):
+    """
+    GS ( k QR code: select the model, module size and error correction level, store the data and print it
+    :param data: bytes, or text encoded in UTF-8
+    :param module_size: size of a module in dots, 1 to 16
+    :param error_correction: one of QR_ERROR_CORRECTION
+    :param model: 1 or 2
+    """
+    if not 1 <= module_size <= 16:
+        raise ValueError("QR code module size should be between 1 and 16 dots")
+    if error_correction not in QR_ERROR_CORRECTION:
+        raise ValueError("Unknown QR code error correction level: %s" % error_correction)
+    if model not in (1, 2):
+        raise ValueError("QR code model should be 1 or 2")
+    data = _symbol_data(data)
+    return (_symbol_command(49, 65, bytearray([48 + model, 0])) +
+            _symbol_command(49, 67, bytearray([module_size])) +
+            _symbol_command(49, 69, bytearray([QR_ERROR_CORRECTION[error_correction]])) +
+            _symbol_command(49, 80, bytearray([48]) + data) +
+            _symbol_command(49, 81, bytearray([48])))
+
+
+def pdf417(data, module_width=3, row_height=3, columns=0, rows=0, error_correction=1, truncated=False):
+    """
+    GS ( k PDF417 symbol: select its layout and error correction level, store the data and print it
+    :param data: bytes, or text encoded in UTF-8
+    :param module_width: width of a module in dots, 2 to 8
+    :param row_height: height of a row in module widths, 2 to 8
+    :param columns: number of data columns, 1 to 30, automatic if 0
+    :param rows: number of rows, 3 to 90, automatic if 0
+    :param error_correction: error correction level, 0 to 8
+    :param truncated: omit the right row indicators and stop pattern
+    """
+    if not 2 <= module_width <= 8:
+        raise ValueError("PDF417 module width should be between 2 and 8 dots")
+    if not 2 <= row_height <= 8:
+        raise ValueError("PDF417 row height should be between 2 and 8 module widths")
+    if not 0 <= columns <= 30:
+        raise ValueError("PDF417 columns should be between 1 and 30, or 0")
+    if rows != 0 and not 3 <= rows <= 90:
+        raise ValueError("PDF417 rows should be between 3 and 90, or 0")
+    if not 0 <= error_correction <= 8:
+        raise ValueError("PDF417 error correction level should be between 0 and 8")
+    data = _symbol_data(data)
+    return (_symbol_command(48, 65, bytearray([columns])) +
+            _symbol_command(48, 66, bytearray([rows])) +
+            _symbol_command(48, 67, bytearray([module_width])) +
+            _symbol_command(48, 68, bytearray([row_height])) +
+            _symbol_command(48, 69, bytearray([48, 48 + error_correction])) +
+            _symbol_command(48, 70, bytearray([1 if truncated else 0])) +
+            _symbol_command(48, 80, bytearray([48]) + data) +
+            _symbol_command(48, 81, bytearray([48])))
+
+
+def _graphics_key(key):
+    if len(key) != 2 or not all(32 <= ord(c) <= 126 for c in key):
+        raise ValueError("Graphics keys are made of two printable ASCII characters")
+    return [ord(c) for c in key]
+
+
+def _graphics_command(params):
+    """ Wrap the parameters of a graphics function in GS ( L, or in GS 8 L when they exceed 64KB """
+    size = len(params)
+    if size <= 0xffff:
+        header = [
+            GS,
+            40,  # (
+            76,  # L
+            size % 256,
+            int(size / 256)]
+    else:
+        header = [
+            GS,
+            56,  # 8
+            76,  # L
+            size & 0xff,
+            (size >> 8) & 0xff,
+            (size >> 16) & 0xff,
+            (size >> 24) & 0xff]
+    return bytearray(header) + params
+
+
+def define_graphics(key, printable_image, nv=False):
+    """
+    Store a raster PrintableImage in the printer under a two characters key, in the download graphics
+    area (lost at power off) or in NV graphics memory.
+    """
+    kc1, kc2 = _graphics_key(key)
+    row_bytes, height, rows = printable_image.raster_rows()
+    width = row_bytes * 8
+    params = bytearray([
+        48,
+        67 if nv else 83,  # fn: define NV / download graphics
+        48,  # monochrome
+        kc1,
+        kc2,
+        1,   # number of colors
+        width % 256,
+        int(width / 256),
+        height % 256,
+        int(height / 256),
+        49])  # color 1
+    return _graphics_command(params + rows)
+
+
+def print_graphics(key, nv=False, scale_x=1, scale_y=1):
+    """ Print graphics stored by define_graphics, scale_x and scale_y being 1 or 2 """
+    kc1, kc2 = _graphics_key(key)
+    return _graphics_command(bytearray([
+        48,
+        69 if nv else 85,  # fn: print NV / download graphics
+        kc1,
+        kc2,
+        scale_x,
+        scale_y]))
+
+
+def delete_graphics(key, nv=False):
+    kc1, kc2 = _graphics_key(key)
+    return _graphics_command(bytearray([
+        48,
+        66 if nv else 82,  # fn: delete NV / download graphics
+        kc1,
+        kc2]))
+
+
+def define_nv_bit_images(*printable_images):
+    """
+    Legacy FS q command, replacing all the NV bit images of the printer by the given raster
+    PrintableImages. They are numbered from 1 in the given order.
+    """
+    import numpy as np
+    byte_array = bytearray([
+        FS,
+        113,  # q
+        len(printable_images)])
+    for printable_image in printable_images:
+        row_bytes, height, rows = printable_image.raster_rows()
+        # Images are sent column by column, with a height rounded to 8 dots
+        y = int(math.ceil(height / 8))
+        pixels = np.zeros((y * 8, row_bytes * 8), dtype=np.uint8)
+        pixels[:height] = np.unpackbits(np.frombuffer(rows, dtype=np.uint8).reshape(height, row_bytes), axis=1)
+        byte_array.extend([
+            row_bytes % 256,
+            int(row_bytes / 256),
+            y % 256,
+            int(y / 256)])
+        byte_array.extend(np.packbits(pixels.T, axis=1).tobytes())
+    return byte_array
+
+
+def print_nv_bit_image(number, mode=0):
+    """ Legacy FS p command, print the NV bit image number (starting at 1) """
+    return [
+        FS,
+        112,  # p
+        number,
+        mode]
+
+
+class PrintableImage(object):
     """
     Container for image data ready to be sent to the printer
     The transformation from bitmap data to PrintableImage data is explained at the link below:
     http://nicholas.piasecki.name/blog/2009/12/sending-a-bit-image-to-an-epson-tm-t88iii-receipt-printer-using-c-and-escpos/
+
+    The payload is kept as a list of byte chunks so that images can be concatenated without
+    copying their data. Chunks are only joined when the image data is actually needed.
     """
 
-    def __init__(self, data, height):
-        self.data = data
+    __slots__ = ('chunks', 'height', 'mode', 'width')
+
+    def __init__(self, data, height, mode=COLUMN_MODE, width=None):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytearray(data)
+        self.chunks = [data] if len(data) else []
         self.height = height
+        self.mode = mode
+        # Width of the image in dots, None if unknown
+        self.width = width
+
+    @property
+    def data(self):
+        """ The whole payload as a single bytes object """
+        return b''.join(self.chunks)
+
+    @property
+    def size(self):
+        """ Size of the payload in bytes """
+        return sum(len(chunk) for chunk in self.chunks)
 
     @classmethod
-    def from_image(cls, image):
+    def from_image(cls, image, mode=COLUMN_MODE, band_height=MAX_RASTER_BAND, dither=None, compact=False,
+                   profile=None):
         """
         Create a PrintableImage from a PIL Image
         :param image: a PIL Image
+        :param mode: COLUMN_MODE to send ESC * stripes printed in page mode, RASTER_MODE to send GS v 0 blocks
+        :param band_height: maximum number of rows of a GS v 0 block in raster mode
+        :param dither: conversion to black and white, see epson_printer.dithering. PIL's Floyd-Steinberg if None
+        :param compact: skip the white parts of the image. In column mode, blank stripes become paper feeds
+                        and every stripe is cropped to its dots, the left margin being skipped with ESC $.
+                        In raster mode, the white columns on the right of the image are not sent.
+        :param profile: the PrinterProfile (or its name) of the printer, giving the width of the image
         :return:
         """
-        (w, h) = image.size
+        start = timer()
+        profile = get_profile(profile)
+        if mode == COLUMN_MODE:
+            pixels = _load_pixels(image, dither, _image_width(profile, mode))
+            printable_image = cls._from_columns(pixels, compact, profile.density)
+        elif mode == RASTER_MODE:
+            profile.require(RASTER)
+            pixels = _load_pixels(image, dither, _image_width(profile, mode))
+            printable_image = cls._from_raster(pixels, band_height, compact)
+        else:
+            raise ValueError("Unknown image mode: %s" % mode)
+        record_encode(timer() - start, image.size[0], image.size[1], mode)
+        return printable_image
+
+    @classmethod
+    def iter_stripes(cls, image, mode=COLUMN_MODE, band_height=24, dither=None, compact=False, profile=None):
+        """
+        Encode a PIL Image band by band, yielding a PrintableImage for each band of band_height rows.
+        Only one band is held as an array at a time, whatever the height of the image.
+        :param image: a PIL Image
+        :param mode: COLUMN_MODE or RASTER_MODE
+        :param band_height: number of rows of each band, a multiple of 24 in column mode
+        :param dither: conversion to black and white, see from_image
+        :param compact: skip the white parts of each band, see from_image
+        :param profile: the PrinterProfile of the printer, see from_image
+        """
+        profile = get_profile(profile)
+        if mode not in (COLUMN_MODE, RASTER_MODE):
+            raise ValueError("Unknown image mode: %s" % mode)
+        if mode == COLUMN_MODE and band_height % 24:
+            raise ValueError("Bands of column mode images are made of 24 dots stripes")
+        if mode == RASTER_MODE:
+            profile.require(RASTER)
+        image = _prepare_image(image, dither, _image_width(profile, mode))
+        # The arguments are checked above, on the call, and the bands encoded as they are iterated
+        return cls._iter_stripes(image, mode, band_height, compact, profile)
 
-        # Thermal paper is 512 pixels wide
-        if w > 512:
-            ratio = 512. / w
-            h = int(h * ratio)
-            image = image.resize((512, h), Image.ANTIALIAS)
-        if image.mode != '1':
-            image = image.convert('1')
+    @classmethod
+    def _iter_stripes(cls, image, mode, band_height, compact, profile):
+        (w, h) = image.size
+        for top in range(0, h, band_height):
+            pixels = _image_pixels(image.crop((0, top, w, min(top + band_height, h))))
+            if mode == COLUMN_MODE:
+                yield cls._from_columns(pixels, compact, profile.density)
+            else:
+                yield cls._from_raster(pixels, band_height, compact)
 
-        pixels = np.array(list(image.getdata())).reshape(h, w)
+    @classmethod
+    def _from_columns(cls, pixels, compact=False, density=DOUBLE_DENSITY):
+        import numpy as np
+        (h, w) = pixels.shape
 
         # Add white pixels so that image fits into bytes
-        extra_rows = int(math.ceil(h / 24)) * 24 - h
-        extra_pixels = np.ones((extra_rows, w), dtype=bool)
-        pixels = np.vstack((pixels, extra_pixels))
-        h += extra_rows
-        nb_stripes = h / 24
-        pixels = pixels.reshape(nb_stripes, 24, w).swapaxes(1, 2).reshape(-1, 8)
+        nb_stripes = int(math.ceil(h / 24))
+        pixels = np.vstack((pixels, np.zeros((nb_stripes * 24 - h, w), dtype=np.uint8)))
+
+        # Each stripe is sent column by column, every column being 24 dots (3 bytes) high
+        columns = np.packbits(pixels.reshape(nb_stripes, 24, w).swapaxes(1, 2), axis=2)
+        return cls.from_columns(columns, compact, density)
+
+    @classmethod
+    def from_columns(cls, columns, compact=False, density=DOUBLE_DENSITY):
+        """
+        Create a column mode PrintableImage from ESC * columns already packed, see epson_printer.glyphs
+        :param columns: a NumPy array of stripes x width x 3 bytes, the 24 dots of every column top to bottom
+        :param compact: skip the white parts of the image, see from_image
+        :param density: ESC * density, see epson_printer.profiles
+        """
+        import numpy as np
+        (nb_stripes, w) = columns.shape[:2]
+        if compact:
+            return cls(_compact_stripes(columns, density), nb_stripes * 24 * 2, width=w)
 
         nh = int(w / 256)
         nl = w % 256
-        data = []
+        header = [
+            ESC,
+            42,  # *
+            density,
+            nl,
+            nh]
+        trailer = [
+            ESC,
+            74,  # J
+            48]
 
-        pixels = np.invert(np.packbits(pixels))
-        stripes = np.split(pixels, nb_stripes)
+        stripes = np.empty((nb_stripes, len(header) + 3 * w + len(trailer)), dtype=np.uint8)
+        stripes[:, :len(header)] = header
+        stripes[:, len(header):-len(trailer)] = columns.reshape(nb_stripes, 3 * w)
+        stripes[:, -len(trailer):] = trailer
 
-        for stripe in stripes:
+        # account for double density mode
+        height = nb_stripes * 24 * 2
+        return cls(stripes.tobytes(), height, width=w)
 
-            data.extend([
-                ESC,
-                42,  # *
-                33,  # double density mode
-                nl,
-                nh])
+    @classmethod
+    def _from_raster(cls, pixels, band_height, compact=False):
+        import numpy as np
+        (h, w) = pixels.shape
 
-            data.extend(stripe)
-            data.extend([
-                27,   # ESC
-                74,   # J
-                48])
+        # Rows are sent top to bottom, 8 dots per byte, padded with white dots
+        rows = np.packbits(pixels, axis=1)
+        if compact:
+            # All the blocks of an image have the same width, so that it can be stored as graphics
+            used = np.flatnonzero(rows.any(axis=0))
+            rows = rows[:, :used[-1] + 1 if len(used) else 1]
+        row_bytes = rows.shape[1]
 
-        # account for double density mode
-        height = h * 2
-        return cls(data, height)
+        printable_image = cls([], h, RASTER_MODE, w)
+        for top in range(0, h, band_height):
+            band = rows[top:top + band_height]
+            printable_image.chunks.append(bytearray([
+                GS,
+                118,  # v
+                48,   # 0
+                0,    # normal density
+                row_bytes % 256,
+                int(row_bytes / 256),
+                len(band) % 256,
+                int(len(band) / 256)]))
+            printable_image.chunks.append(band.tobytes())
+        return printable_image
+
+    def raster_rows(self):
+        """
+        Rows of a raster image without the GS v 0 headers.
+        :return: (bytes per row, number of rows, rows data)
+        """
+        if self.mode != RASTER_MODE:
+            raise ValueError("Only raster mode images can be stored in the printer")
+        data = memoryview(self.data)
+        offset = 0
+        row_bytes = None
+        height = 0
+        rows = []
+        while offset < len(data):
+            header = bytearray(data[offset:offset + 8])
+            x = header[4] + 256 * header[5]
+            y = header[6] + 256 * header[7]
+            if header[:4] != bytearray([GS, 118, 48, 0]) or row_bytes not in (None, x):
+                raise ValueError("Malformed raster image")
+            row_bytes = x
+            offset += 8
+            rows.append(data[offset:offset + x * y])
+            offset += x * y
+            height += y
+        return row_bytes or 0, height, b''.join(rows)
+
+    def copy(self):
+        """ A new PrintableImage sharing the chunks of this one, that can be appended to on its own """
+        printable_image = PrintableImage([], self.height, self.mode, self.width)
+        printable_image.chunks = list(self.chunks)
+        return printable_image
 
     def append(self, other):
         """
@@ -158,43 +587,295 @@ class PrintableImage:
         :param other: another PrintableImage
         :return: PrintableImage containing data from both self and other
         """
-        self.data.extend(other.data)
+        if not self.chunks:
+            self.mode = other.mode
+        elif other.chunks and other.mode != self.mode:
+            raise ValueError("Cannot append a %s mode image to a %s mode image" % (other.mode, self.mode))
+        self.chunks.extend(other.chunks)
         self.height = self.height + other.height
+        self.width = max(self.width or 0, other.width or 0) or None
         return self
 
+    def save(self, file, source_hash=None, params_hash=None):
+        """
+        Write the image as a job file, loaded back with PrintableImage.load without being encoded again
+        :param file: a path or a binary file object
+        :param source_hash: SHA-256 digest (32 bytes) of the source image, to tell whether a job file is up to date
+        :param params_hash: SHA-256 digest (32 bytes) of the encoding parameters, for the same purpose
+        """
+        if hasattr(file, 'write'):
+            file.write(JOB_FILE_HEADER.pack(
+                JOB_FILE_MAGIC, JOB_FILE_VERSION, JOB_FILE_MODES.index(self.mode), self.width or 0, self.height,
+                self.size, source_hash or b'', params_hash or b''))
+            file.writelines(self.chunks)
+            return
+        with open(file, 'wb') as f:
+            self.save(f, source_hash, params_hash)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Read a job file written by save
+        :param file: a path or a binary file object
+        """
+        if not hasattr(file, 'read'):
+            with open(file, 'rb') as f:
+                return cls.load(f)
+        header = read_job_header(file)
+        data = file.read(header.size)
+        if len(data) != header.size:
+            raise ValueError("Truncated job file")
+        return cls(data, header.height, header.mode, header.width or None)
+
+
+def read_job_header(file):
+    """
+    Read the header of a job file, leaving the file object at the start of the payload
+    :return: a JobHeader
+    """
+    data = file.read(JOB_FILE_HEADER.size)
+    if len(data) != JOB_FILE_HEADER.size or data[:4] != JOB_FILE_MAGIC:
+        raise ValueError("Not a job file")
+    if data[4] != JOB_FILE_VERSION:
+        raise ValueError("Unsupported job file version: %d" % data[4])
+    magic, version, mode, width, height, size, source_hash, params_hash = JOB_FILE_HEADER.unpack(data)
+    return JobHeader(version, JOB_FILE_MODES[mode], width, height, size, source_hash, params_hash)
+
+
+def _feed(units):
+    """ ESC J commands feeding the paper by a number of motion units """
+    commands = []
+    while units > 0:
+        commands.extend([ESC, 74, min(units, 255)])  # J
+        units -= 255
+    return commands
+
+
+def _compact_stripes(columns, density=DOUBLE_DENSITY):
+    """
+    ESC * stripes of an array of packed columns (stripes x width x 3) without their white parts.
+    Blank stripes are not sent, their feeds are merged with the ones of the previous stripes.
+    The other ones are cropped to their first and last black columns, the margin being skipped
+    with ESC $ when that is shorter than sending white columns.
+    """
+    import numpy as np
+    inked = columns.any(axis=2)
+    chunks = []
+    feed = 0
+    for stripe, dots in zip(columns, inked):
+        used = np.flatnonzero(dots)
+        if len(used):
+            commands = _feed(feed)
+            feed = 0
+            left = int(used[0]) if used[0] >= 2 else 0
+            right = int(used[-1]) + 1
+            if left:
+                # Single density columns are two motion units wide
+                position = left if density == DOUBLE_DENSITY else 2 * left
+                commands.extend([ESC, 36, position % 256, position // 256])  # $
+            commands.extend([ESC, 42, density, (right - left) % 256, (right - left) // 256])  # *
+            chunks.append(bytearray(commands))
+            chunks.append(stripe[left:right].tobytes())
+        # Each stripe is 48 motion units high in double density mode
+        feed += 48
+    chunks.append(bytearray(_feed(feed)))
+    return b''.join(chunks)
+
+
+def open_image(image_file, width=512):
+    """
+    Open an image file to be printed width dots wide. Images much wider are decoded at a reduced
+    resolution, at least width pixels wide, so that the pixels thrown away by the final resize are not
+    decoded: JPEG decoders scale by 1/2 to 1/8 (in grayscale), other images are reduced by an integer factor.
+    """
+    from PIL import Image
+    image = Image.open(image_file)
+    (w, h) = image.size
+    if w >= 2 * width:
+        # Only JPEG images have a draft mode, it is a no-op otherwise
+        image.draft('L', (width, 1))
+        (w, h) = image.size
+    if w >= 2 * width and image.mode not in ('1', 'P'):
+        image = image.reduce(w // width)
+    return image
+
+
+def b64decode(data, chunk_size=BASE64_CHUNK_SIZE):
+    """
+    base64.b64decode decoding chunk by chunk, so that only the decoded bytes and one chunk of text are
+    held at once, whatever the size of the text. Like base64.b64decode, characters out of the base64
+    alphabet (line breaks, spaces...) are ignored.
+    :param data: base64 text, bytes, or a file object reading either
+    """
+    if hasattr(data, 'read'):
+        chunks = iter(lambda: data.read(chunk_size), data.read(0))
+    else:
+        chunks = (data[start:start + chunk_size] for start in range(0, len(data), chunk_size))
+    decoded = io.BytesIO()
+    pending = b''
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('ascii')
+        # Quanta of 4 characters may be split by the ignored characters and by the chunks
+        chunk = pending + chunk.translate(None, _BASE64_IGNORED)
+        end = len(chunk) - len(chunk) % 4
+        decoded.write(binascii.a2b_base64(chunk[:end]))
+        pending = chunk[end:]
+    if pending:
+        decoded.write(binascii.a2b_base64(pending))
+    return decoded.getvalue()
+
+
+def _image_width(profile, mode):
+    """ Width of the images of a PrinterProfile, in ESC * columns in column mode and in dots in raster mode """
+    return profile.column_width if mode == COLUMN_MODE else profile.width
+
+
+def _prepare_image(image, dither=None, width=512):
+    """
+    Resize a PIL image to the paper width (in dots, see PrinterProfile) and convert it to black and white
+    """
+    from PIL import Image
+    from .dithering import get_ditherer
+    (w, h) = image.size
+
+    if w > width:
+        ratio = width / w
+        h = int(h * ratio)
+        w = width
+        image = image.resize((w, h), Image.LANCZOS)
+    if image.mode != '1':
+        image = get_ditherer(dither)(image)
+    return image
+
+
+def _image_pixels(image):
+    """
+    Array of dots of a mode '1' PIL image, 1 meaning black
+    """
+    import numpy as np
+    (w, h) = image.size
+
+    # Mode '1' images are stored as rows of packed bits where 1 is white. Unpack them
+    # straight from the image buffer and flip them so that 1 means "print a dot"
+    row_bytes = int(math.ceil(w / 8))
+    rows = np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(h, row_bytes)
+    return np.unpackbits(rows, axis=1)[:, :w] ^ 1
+
+
+def _load_pixels(image, dither=None, width=512):
+    return _image_pixels(_prepare_image(image, dither, width))
+
+
+class PrintJob(object):
+    """
+    Buffers everything written to a printer and sends it in as few transfers as possible.
+    Use it as a context manager through EpsonPrinter.job():
+
+        with printer.job() as job:
+            job.bold_on()
+            job.print_text("Total")
+            ...
+
+    The printer methods, called on the job or on the printer itself, are buffered until the
+    outermost block exits or flush() is called. Nothing is sent if the block raises.
+    """
+
+    def __init__(self, printer):
+        self.printer = printer
+        self.buffers = []
+        self.callbacks = []
+        self.depth = 0
+        self.started = None
+
+    def __enter__(self):
+        if self.depth == 0:
+            self.printer._job = self
+            self.started = timer()
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0:
+            self.printer._job = None
+            if exc_type is None:
+                self.flush()
+            else:
+                self.buffers = []
+                self.callbacks = []
+
+    def __getattr__(self, name):
+        return getattr(self.printer, name)
+
+    def write(self, buffers):
+        self.buffers.extend(buffers)
+
+    def on_sent(self, callback):
+        """ Call callback() once the data buffered so far is sent, never if it is discarded """
+        self.callbacks.append(callback)
+
+    def flush(self):
+        """ Send the buffered data to the printer """
+        buffers = self.buffers
+        callbacks = self.callbacks
+        self.buffers = []
+        self.callbacks = []
+        if buffers:
+            self.printer._send(buffers)
+            if self.started is not None:
+                self.printer.stats.record_job(sum(len(buf) for buf in buffers), timer() - self.started)
+        self.started = timer()
+        for callback in callbacks:
+            callback()
+
 
 class EpsonPrinter:
     """ An Epson thermal printer based on ESC/POS"""
 
-    printer = None
+    transport = None
+    stats = None
+    profile = None
+    code_page = None
+    _job = None
 
-    def __init__(self, id_vendor, id_product, out_ep=0x01):
+    def __init__(self, id_vendor=None, id_product=None, out_ep=0x01, buffer_size=None, timeout=5000, progress=None,
+                 encoding='cp437', transport=None, image_cache=None, name=None, in_ep=0x82, profile=None,
+                 text_encoder=None):
         """
-        @param id_vendor  : Vendor ID
-        @param id_product : Product ID
-        @param interface : USB device interface
-        @param in_ep     : Input end point
-        @param out_ep    : Output end point
+        @param id_vendor   : Vendor ID
+        @param id_product  : Product ID
+        @param interface   : USB device interface
+        @param in_ep       : Input end point, where the printer sends its status
+        @param out_ep      : Output end point
+        @param buffer_size : Maximum size of a single USB transfer. Defaults to the maximum transfer size of
+                             the profile, or to 64 packets of the output end point
+        @param timeout     : Timeout of a single transfer in milliseconds
+        @param progress    : Callable receiving (bytes_sent, bytes_total) after each transfer
+        @param encoding    : Encoding used to send unicode text. When it is one of the code pages of
+                             epson_printer.codepages, print_text switches to other pages for the characters
+                             it does not have
+        @param transport   : Transport to the printer, see epson_printer.transport. The USB parameters above
+                             are ignored when it is given
+        @param image_cache : An epson_printer.cache.ImageCache reused by print_image_from_file and
+                             print_image_from_buffer, images are encoded on every call if None
+        @param name        : Name of the printer in the log messages
+        @param profile     : PrinterProfile of the printer model or its name, see epson_printer.profiles
+        @param text_encoder: epson_printer.codepages.TextEncoder of print_text, one over the code pages of
+                             the profile if None
         """
 
-        self.out_ep = out_ep
-
-        # Search device on USB tree and set is as printer
-        self.printer = usb.core.find(idVendor=id_vendor, idProduct=id_product)
-        if self.printer is None:
-            raise ValueError("Printer not found. Make sure the cable is plugged in.")
-
-        if self.printer.is_kernel_driver_active(0):
-            try:
-                self.printer.detach_kernel_driver(0)
-            except usb.core.USBError as e:
-                print("Could not detatch kernel driver: %s" % str(e))
-
-        try:
-            self.printer.set_configuration()
-            self.printer.reset()
-        except usb.core.USBError as e:
-            print("Could not set configuration: %s" % str(e))
+        self.profile = get_profile(profile)
+        if transport is None:
+            transport = UsbTransport(id_vendor, id_product, out_ep, buffer_size or self.profile.max_transfer, timeout,
+                                     progress, in_ep)
+        self.transport = transport
+        self.encoding = encoding
+        # Code page shown by the printer, print_text sends text encoded with self.encoding if None
+        self.code_page = encoding if encoding in CODE_PAGES else None
+        self.text_encoder = text_encoder or TextEncoder(self.profile.code_pages)
+        self.image_cache = image_cache
+        self.stats = PrinterStats(name)
 
     def write_this(func):
         """
@@ -207,14 +888,158 @@ class EpsonPrinter:
         return wrapper
 
     def write_bytes(self, byte_array):
-        msg = ''.join([chr(b) for b in byte_array])
-        self.write(msg)
+        self.write(bytearray(byte_array))
 
     def write(self, msg):
-        self.printer.write(self.out_ep, msg, timeout=20000)
+        self.writev([msg])
+
+    def writev(self, buffers):
+        """
+        Write a list of buffers, streamed to the printer in transfers of at most buffer_size bytes,
+        or buffered until the end of the current job. Unicode text is encoded with the printer encoding.
+        """
+        buffers = [buf if isinstance(buf, (bytes, bytearray, memoryview)) else buf.encode(self.encoding)
+                   for buf in buffers]
+        if self._job is not None:
+            self._job.write(buffers)
+        else:
+            self._send(buffers)
+
+    def _send(self, buffers):
+        size = sum(map(len, buffers))
+        start = timer()
+        try:
+            self.transport.writev(buffers)
+        except Exception as e:
+            self.stats.record_error(e, size, timer() - start)
+            raise
+        self.stats.record_write(size, timer() - start)
+
+    def get_stats(self):
+        """
+        Snapshot of the counters and timings of the printer, see epson_printer.instrumentation.
+        Listeners of the writes, jobs and errors are added with printer.stats.add_listener(listener).
+        """
+        return self.stats.snapshot(self.transport)
+
+    def close(self):
+        self.transport.close()
+
+    def query_status(self, timeout=1.0):
+        """
+        Query the status of the printer with DLE EOT. Sent at once, even inside a job.
+        :param timeout: maximum time to wait for each reply, in seconds
+        :return: a PrinterStatus, see epson_printer.status
+        """
+        self.profile.require(STATUS)
+        return self.transport.query_status(timeout)
+
+    @write_this
+    def enable_asb(self, flags=ASB_ONLINE | ASB_ERROR | ASB_PAPER):
+        """Enable automatic status back: the printer sends its status whenever it changes, see read_asb."""
+        self.profile.require(STATUS)
+        return enable_asb(flags)
+
+    def read_asb(self, timeout=None):
+        """
+        Wait for an automatic status sent by the printer, None if none was received within timeout seconds
+        """
+        data = self.transport.read(4, timeout)
+        return PrinterStatus.from_asb(data) if data else None
+
+    @contextmanager
+    def capture(self, file, send=False):
+        """
+        Record everything written to the printer in the block into a file, to be sent later with replay:
+
+            with printer.capture('menu.bin'):
+                printer.print_image(...)
+                printer.cut()
+
+        :param file: a path or a binary file object
+        :param send: also send the data to the printer, it is only recorded otherwise
+        """
+        if self._job is not None:
+            self._job.flush()
+        recorder = FileTransport(file, 'wb')
+        transport = self.transport
+        self.transport = TeeTransport([transport, recorder]) if send else recorder
+        try:
+            yield recorder
+            if self._job is not None:
+                self._job.flush()
+        except BaseException:
+            # Data of the block still buffered by the outer job must not reach the real printer later
+            if self._job is not None:
+                self._job.buffers = []
+                self._job.callbacks = []
+            raise
+        finally:
+            self.transport = transport
+            recorder.close()
+
+    def replay(self, file, chunk_size=REPLAY_CHUNK_SIZE):
+        """
+        Send a file recorded by capture. The file is memory mapped and sent chunk by chunk without being
+        copied, whatever its size. Sent at once, even inside a job.
+        :param file: a path or a binary file object
+        :param chunk_size: maximum size of a write
+        """
+        if not hasattr(file, 'fileno'):
+            with open(file, 'rb') as f:
+                return self.replay(f, chunk_size)
+        if self._job is not None:
+            self._job.flush()
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = memoryview(mapping)
+            try:
+                for offset in range(0, size, chunk_size):
+                    self._send_chunk(view, offset, offset + chunk_size)
+            finally:
+                view.release()
+        finally:
+            mapping.close()
+
+    def _send_chunk(self, view, start, end):
+        chunk = view[start:end]
+        try:
+            self._send([chunk])
+        finally:
+            # The traceback of a failed write still refers to the chunk, which must not keep the
+            # mapping exported or closing it would replace the error of the transport by a BufferError
+            chunk.release()
+
+    def job(self):
+        """
+        Start a print job, see PrintJob. Returns the current job if one is already running.
+        """
+        return self._job or PrintJob(self)
+
+    def on_sent(self, callback):
+        """
+        Call callback() once everything written so far is sent: at once outside a job, when the job is
+        flushed inside one, never if the job is discarded
+        """
+        if self._job is not None:
+            self._job.on_sent(callback)
+        else:
+            callback()
 
     def print_text(self, msg):
-        self.write(msg)
+        if self.code_page is None or isinstance(msg, (bytes, bytearray, memoryview)):
+            self.write(msg)
+            return
+        data, self.code_page = self.text_encoder.encode(msg, self.code_page)
+        self.write(data)
+
+    def set_code_page(self, name):
+        """ Select a code page with ESC t, see epson_printer.codepages.CODE_PAGES """
+        self.write_bytes(select_code_page(name))
+        self.code_page = name
 
     @write_this
     def linefeed(self, lines=1):
@@ -226,20 +1051,61 @@ class EpsonPrinter:
         """Full paper cut."""
         return FULL_PAPER_CUT
 
-    @write_this
     def print_image(self, printable_image):
-        dyl = printable_image.height % 256
-        dyh = int(printable_image.height / 256)
+        if printable_image.mode == RASTER_MODE:
+            self.profile.require(RASTER)
+        width = _image_width(self.profile, printable_image.mode)
+        if (printable_image.width or 0) > width:
+            raise ValueError("The image is %d dots wide, %s printers print %d dots" % (
+                printable_image.width, self.profile.name, width))
+        if printable_image.mode == RASTER_MODE or not self.profile.supports(PAGE_MODE):
+            # GS v 0 blocks are printed in standard mode, ESC * stripes too when there is no page mode
+            self.writev(printable_image.chunks)
+            return
+
+        chunks = [self._enter_page_mode(printable_image.height)]
+        chunks.extend(printable_image.chunks)
+
+        # Return to standard mode
+        chunks.append(bytearray([12]))
+
+        self.writev(chunks)
+
+    def print_image_stream(self, image, mode=COLUMN_MODE, band_height=24, dither=None, compact=False):
+        """
+        Print a PIL Image while it is being encoded: every band is written as soon as it is ready, so the
+        printer starts before the whole image is converted and memory use does not depend on its height.
+        Bands are buffered like any other write inside a job.
+        """
+        image = _prepare_image(image, dither, _image_width(self.profile, mode))
+        stripes = PrintableImage.iter_stripes(image, mode, band_height, compact=compact, profile=self.profile)
+        if mode == RASTER_MODE or not self.profile.supports(PAGE_MODE):
+            for stripe in stripes:
+                self.writev(stripe.chunks)
+            return
+
+        # account for double density mode
+        height = int(math.ceil(image.size[1] / 24)) * 24 * 2
+        self.writev([self._enter_page_mode(height)])
+        for stripe in stripes:
+            self.writev(stripe.chunks)
+        self.write_bytes([12])
+
+    def _enter_page_mode(self, height):
+        x = self.profile.page_x
+        dx = self.profile.width
+        dyl = height % 256
+        dyh = int(height / 256)
         # Set the size of the print area
         byte_array = [
             ESC,
             87,    # W
-            46,    # xL
-            0,     # xH
+            x % 256,
+            x // 256,
             0,     # yL
             0,     # yH
-            0,     # dxL
-            2,     # dxH
+            dx % 256,
+            dx // 256,
             dyl,
             dyh]
 
@@ -248,34 +1114,77 @@ class EpsonPrinter:
             27,
             76])
 
-        byte_array.extend(printable_image.data)
+        return bytearray(byte_array)
 
-        # Return to standard mode
-        byte_array.append(12)
+    def print_text_image(self, text, font=None, size=18, compact=False):
+        """
+        Print text drawn as a bit image, for the scripts the printer fonts cannot show, see epson_printer.glyphs
+        :param font: path of a TrueType font, PIL's default font if None
+        :param size: size of the font in pixels
+        """
+        from .glyphs import TextRenderer
+        self.print_image(TextRenderer(font, size, self.profile).render(text, compact))
 
-        return byte_array
+    def print_job_file(self, file):
+        """
+        Print an image pre-encoded in a job file, see PrintableImage.save and epson_printer.precompile
+        """
+        self.print_image(PrintableImage.load(file))
+
+    def print_template(self, template, **values):
+        """
+        Print a receipt from a Template compiled by epson_printer.template.compile_template, in a single write
+        """
+        buffers = template.render_values(values, self.text_encoder)
+        if template.code_page is not None and self.code_page is not None:
+            # The template starts on the code page of its encoding
+            if self.code_page != template.encoding:
+                buffers.insert(0, bytearray(select_code_page(template.encoding)))
+            self.code_page = template.code_page
+        self.writev(buffers)
 
     def print_images(self, *printable_images):
         """
         This method allows printing several images in one shot. This is useful if the client code does not want the
         printer to make pause during printing
         """
-        printable_image = reduce(lambda x, y: x.append(y), list(printable_images))
+        printable_image = PrintableImage([], 0)
+        for other in printable_images:
+            printable_image.append(other)
         self.print_image(printable_image)
 
-    def print_image_from_file(self, image_file, rotate=False):
-        image = Image.open(image_file)
-        if rotate:
-            image = image.rotate(180)
-        printable_image = PrintableImage.from_image(image)
-        self.print_image(printable_image)
+    def print_image_from_file(self, image_file, rotate=False, mode=COLUMN_MODE, dither=None, compact=False):
+        if self.image_cache is None:
+            self.print_image(self._encode_image(image_file, rotate, mode, dither, compact))
+            return
+        if hasattr(image_file, 'read'):
+            source = image_file.read()
+        else:
+            with open(image_file, 'rb') as f:
+                source = f.read()
+        self.print_image(self._encode_cached_image(source, rotate, mode, dither, compact))
+
+    def print_image_from_buffer(self, data, rotate=False, mode=COLUMN_MODE, dither=None, compact=False):
+        """
+        Print a base64 encoded image file
+        :param data: base64 text, or a file object reading it
+        """
+        source = b64decode(data)
+        if self.image_cache is None:
+            self.print_image(self._encode_image(io.BytesIO(source), rotate, mode, dither, compact))
+        else:
+            self.print_image(self._encode_cached_image(source, rotate, mode, dither, compact))
 
-    def print_image_from_buffer(self, data, rotate=False):
-        image = Image.open(io.BytesIO(base64.b64decode(data)))
+    def _encode_image(self, image_file, rotate, mode, dither, compact):
+        image = open_image(image_file, self.profile.width)
         if rotate:
             image = image.rotate(180)
-        printable_image = PrintableImage.from_image(image)
-        self.print_image(printable_image)
+        return PrintableImage.from_image(image, mode, dither=dither, compact=compact, profile=self.profile)
+
+    def _encode_cached_image(self, source, rotate, mode, dither, compact):
+        return self.image_cache.get_or_encode(
+            source, lambda: self._encode_image(io.BytesIO(source), rotate, mode, dither, compact),
+            rotate=rotate, mode=mode, dither=dither, compact=compact, profile=self.profile)
 
     @write_this
     def underline_on(self, weight=1):
@@ -328,3 +1237,51 @@ class EpsonPrinter:
     @write_this
     def set_print_speed(self, speed):
         return set_print_speed(speed)
+
+    @write_this
+    def define_graphics(self, key, printable_image, nv=False):
+        """Store a raster PrintableImage in the printer under a two characters key. NV memory survives
+        power cycles but wears out, see epson_printer.graphics.GraphicsRegistry to avoid rewriting it."""
+        self.profile.require(GRAPHICS)
+        return define_graphics(key, printable_image, nv)
+
+    @write_this
+    def print_graphics(self, key, nv=False, scale_x=1, scale_y=1):
+        """Print graphics stored with define_graphics."""
+        self.profile.require(GRAPHICS)
+        return print_graphics(key, nv, scale_x, scale_y)
+
+    @write_this
+    def delete_graphics(self, key, nv=False):
+        self.profile.require(GRAPHICS)
+        return delete_graphics(key, nv)
+
+    @write_this
+    def define_nv_bit_images(self, *printable_images):
+        """Legacy FS q command. Replaces all the NV bit images of the printer."""
+        self.profile.require(GRAPHICS)
+        return define_nv_bit_images(*printable_images)
+
+    @write_this
+    def print_nv_bit_image(self, number, mode=0):
+        """Legacy FS p command."""
+        self.profile.require(GRAPHICS)
+        return print_nv_bit_image(number, mode)
+
+    @write_this
+    def barcode(self, data, symbology='CODE128', height=162, module_width=3, hri=HRI_BELOW, hri_font=0):
+        """Print a 1D barcode drawn by the printer, see the barcode function for the parameters."""
+        self.profile.require(BARCODES)
+        return barcode(data, symbology, height, module_width, hri, hri_font)
+
+    @write_this
+    def qr_code(self, data, module_size=3, error_correction='M', model=2):
+        """Print a QR code drawn by the printer. A few dozen bytes instead of a bit image."""
+        self.profile.require(CODES_2D)
+        return qr_code(data, module_size, error_correction, model)
+
+    @write_this
+    def pdf417(self, data, module_width=3, row_height=3, columns=0, rows=0, error_correction=1, truncated=False):
+        """Print a PDF417 symbol drawn by the printer, see the pdf417 function for the parameters."""
+        self.profile.require(CODES_2D)
+        return pdf417(data, module_width, row_height, columns, rows, error_correction, truncated)
@@ -0,0 +1,156 @@
+"""
+Text drawn as bit images, for the scripts the printer fonts cannot show (CJK, Arabic, Hebrew...).
+
+    renderer = TextRenderer('/usr/share/fonts/noto/NotoSansCJK-Regular.ttc', 24)
+    printer.print_image(renderer.render(u"豆腐と味噌汁  \xa5480"))
+
+Characters are drawn once, packed into the 3-byte columns of ESC * stripes and kept in a bounded LRU
+cache keyed by font, size and code point. A line is then assembled by copying the packed columns of
+its characters, without drawing or converting any pixel. Characters are laid out one after the other,
+left to right and without kerning: right-to-left and joining scripts are given in visual order and
+already shaped (presentation forms).
+"""
+from __future__ import division
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from .epsonprinter import PrintableImage
+from .profiles import get_profile
+
+# Number of glyphs kept by the default cache
+GLYPH_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def load_font(font, size):
+    """ A PIL font from the path of a TrueType font, PIL's default font if None """
+    from PIL import ImageFont
+    if font is not None:
+        return ImageFont.truetype(font, size)
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1, a fixed size bitmap font
+        return ImageFont.load_default()
+
+
+def render_glyph(char, font=None, size=18, rows=None):
+    """
+    Draw a character and pack it into ESC * columns
+    :param font: path of a TrueType font, PIL's default font if None
+    :param size: size of the font in pixels
+    :param rows: height of the glyph in dots, the character standing at its bottom. By default the line
+                 height of the font rounded up to whole 24-dot stripes, the character at the top
+    :return: a NumPy array of stripes x width x 3 bytes
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+    face = load_font(font, size)
+    ascent, descent = face.getmetrics()
+    if rows is None:
+        rows = int(math.ceil((ascent + descent) / 24)) * 24
+        top = 0
+    else:
+        top = max(rows - ascent - descent, 0)
+    width = max(int(round(face.getlength(char))), 1)
+    image = Image.new('L', (width, rows), 255)
+    ImageDraw.Draw(image).text((0, top), char, font=face, fill=0)
+    dots = np.asarray(image) < 128
+    return np.packbits(dots.reshape(rows // 24, 24, width).swapaxes(1, 2), axis=2)
+
+
+class GlyphCache(object):
+    """ LRU cache of the packed columns of characters, see render_glyph """
+
+    def __init__(self, max_glyphs=GLYPH_CACHE_SIZE):
+        """
+        @param max_glyphs : Maximum number of glyphs kept
+        """
+        self.max_glyphs = max_glyphs
+        self.hits = 0
+        self.misses = 0
+        self._glyphs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, char, font=None, size=18):
+        """ The packed columns of a character, drawn on the first call """
+        key = (font, size, ord(char))
+        with self._lock:
+            columns = self._glyphs.get(key)
+            if columns is not None:
+                self._glyphs.move_to_end(key)
+                self.hits += 1
+                return columns
+            self.misses += 1
+        columns = render_glyph(char, font, size)
+        columns.flags.writeable = False
+        with self._lock:
+            self._glyphs[key] = columns
+            while len(self._glyphs) > self.max_glyphs:
+                self._glyphs.popitem(last=False)
+        return columns
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'glyphs': len(self._glyphs)}
+
+    def clear(self):
+        with self._lock:
+            self._glyphs.clear()
+
+
+# Shared by the renderers unless they are given their own cache
+GLYPHS = GlyphCache()
+
+
+class TextRenderer(object):
+    """ Renders text into column mode PrintableImages, see the module documentation """
+
+    def __init__(self, font=None, size=18, profile=None, cache=None):
+        """
+        @param font    : Path of a TrueType font, PIL's default font if None
+        @param size    : Size of the font in pixels
+        @param profile : PrinterProfile of the printer, lines wider than its paper are wrapped
+        @param cache   : GlyphCache of the glyphs, GLYPHS if None
+        """
+        self.font = font
+        self.size = size
+        self.profile = get_profile(profile)
+        self.cache = cache if cache is not None else GLYPHS
+
+    def render(self, text, compact=False):
+        """
+        Render text, one or more lines separated by line feeds
+        :param compact: skip the white parts of the image, see PrintableImage.from_image
+        :return: a column mode PrintableImage
+        """
+        import numpy as np
+        width = self.profile.column_width
+        lines = []
+        for line in text.splitlines() or [u'']:
+            glyphs = []
+            line_width = 0
+            for char in line:
+                columns = self.cache.get(char, self.font, self.size)
+                if line_width + columns.shape[1] > width and glyphs:
+                    lines.append((glyphs, line_width))
+                    glyphs = []
+                    line_width = 0
+                glyphs.append(columns)
+                line_width += columns.shape[1]
+            lines.append((glyphs, line_width))
+
+        stripes = self.cache.get(u' ', self.font, self.size).shape[0]
+        image_width = max(min(max(line_width for _, line_width in lines), width), 1)
+        columns = np.zeros((stripes * len(lines), image_width, 3), dtype=np.uint8)
+        for index, (glyphs, _) in enumerate(lines):
+            left = 0
+            for glyph in glyphs:
+                glyph_width = min(glyph.shape[1], image_width - left)
+                columns[index * stripes:(index + 1) * stripes, left:left + glyph_width] = glyph[:, :glyph_width]
+                left += glyph_width
+        return PrintableImage.from_columns(columns, compact, self.profile.density)
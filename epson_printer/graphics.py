@@ -0,0 +1,76 @@
+"""
+Tracks the images stored in the printers, so that they are uploaded once and then printed by key.
+
+    registry = GraphicsRegistry('/var/lib/epson/graphics.json')
+    logo = PrintableImage.from_image(Image.open('logo.png'), RASTER_MODE)
+    registry.print_image(printer, 'till-1', 'LG', logo, nv=True)
+
+The first call stores the logo in the NV memory of the printer, the following ones only send
+the few bytes of the print command. The image is uploaded again when its content changes.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def content_hash(printable_image):
+    return hashlib.sha256(printable_image.data).hexdigest()
+
+
+class GraphicsRegistry(object):
+    """ Content hashes of the graphics stored in each device, by key """
+
+    def __init__(self, path=None):
+        """
+        @param path : JSON file where the registry is saved, kept in memory only if None. Download
+                      graphics are lost when the printer is switched off, only persist NV graphics.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._devices = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._devices = json.load(f)
+
+    def get(self, device, key):
+        """ Content hash of the image stored under key in device, None if unknown """
+        with self._lock:
+            return self._devices.get(device, {}).get(key)
+
+    def record(self, device, key, digest):
+        with self._lock:
+            self._devices.setdefault(device, {})[key] = digest
+            self._save()
+
+    def forget(self, device, key=None):
+        """ Forget one key of a device, or all of them (e.g. after a reset of the printer) """
+        with self._lock:
+            if key is None:
+                self._devices.pop(device, None)
+            else:
+                self._devices.get(device, {}).pop(key, None)
+            self._save()
+
+    def print_image(self, printer, device, key, printable_image, nv=False):
+        """
+        Print a raster PrintableImage stored under key, uploading it first if the device does not
+        hold this exact image yet.
+        :param printer: the EpsonPrinter
+        :param device: name identifying the printer in the registry
+        """
+        digest = content_hash(printable_image)
+        if self.get(device, key) != digest:
+            printer.define_graphics(key, printable_image, nv)
+            # Inside a job the upload is only buffered, and lost if the job fails
+            printer.on_sent(lambda: self.record(device, key, digest))
+        printer.print_graphics(key, nv)
+
+    def _save(self):
+        if self.path is None:
+            return
+        fd, path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._devices, f)
+        os.replace(path, self.path)
@@ -0,0 +1,150 @@
+"""
+Metrics of the printers: bytes, writes, transfers, errors and timings.
+
+Every EpsonPrinter keeps a PrinterStats in its stats attribute:
+
+    printer.stats.add_listener(lambda event, data: statsd.timing('printer.' + event, data['seconds']))
+    ...
+    printer.stats.snapshot()  # {'writes': 12, 'bytes': 20345, ..., 'write_seconds': {...}}
+
+Listeners are called with an event name ('write', 'job', 'error' or 'encode') and a dict of values.
+Image encoding is not tied to a printer: its times go to the module level ENCODE_TIMES histogram,
+included in every snapshot, and to the ENCODE_LISTENERS. Everything is also logged under
+the 'epson_printer' logger, at DEBUG level for writes and WARNING level for errors.
+"""
+import bisect
+import errno
+import logging
+import socket
+import threading
+from timeit import default_timer as timer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   10, float('inf'))
+
+
+class Histogram(object):
+    """ Distribution of durations over fixed buckets """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._observe(value)
+
+    def _observe(self, value):
+        # Callers hold the lock
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'sum': self.sum,
+                'buckets': list(zip(self.buckets, self.counts))}
+
+
+ENCODE_TIMES = Histogram()
+ENCODE_LISTENERS = []
+
+
+def record_encode(seconds, width, height, mode):
+    """ Called by PrintableImage.from_image """
+    ENCODE_TIMES.observe(seconds)
+    data = {'seconds': seconds, 'width': width, 'height': height, 'mode': mode}
+    for listener in ENCODE_LISTENERS:
+        listener('encode', data)
+
+
+def is_timeout(error):
+    """ Whether an error raised by a transport is a timeout (USBTimeoutError, socket.timeout) """
+    return (isinstance(error, socket.timeout) or getattr(error, 'errno', None) == errno.ETIMEDOUT or
+            'Timeout' in type(error).__name__)
+
+
+class PrinterStats(object):
+    """ Counters and timings of the writes of a printer """
+
+    def __init__(self, name=None):
+        """
+        @param name : Printer name used in the log messages
+        """
+        self.name = name
+        self.listeners = []
+        self.writes = 0
+        self.bytes = 0
+        self.jobs = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.write_seconds = Histogram()
+        self.job_seconds = Histogram()
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """ listener(event, data) is called after every write, job and error """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def _emit(self, event, data):
+        for listener in self.listeners:
+            listener(event, data)
+
+    def record_write(self, size, seconds):
+        with self.write_seconds._lock:
+            self.writes += 1
+            self.bytes += size
+            self.write_seconds._observe(seconds)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s: wrote %d bytes in %.6fs", self.name or 'printer', size, seconds)
+        if self.listeners:
+            self._emit('write', {'bytes': size, 'seconds': seconds})
+
+    def record_job(self, size, seconds):
+        with self.job_seconds._lock:
+            self.jobs += 1
+            self.job_seconds._observe(seconds)
+        logger.debug("%s: job of %d bytes in %.6fs", self.name or 'printer', size, seconds)
+        if self.listeners:
+            self._emit('job', {'bytes': size, 'seconds': seconds})
+
+    def record_error(self, error, size, seconds):
+        timeout = is_timeout(error)
+        with self._lock:
+            self.errors += 1
+            self.timeouts += timeout
+        logger.warning("%s: %s after %.3fs writing %d bytes: %s", self.name or 'printer',
+                       'timeout' if timeout else 'error', seconds, size, error)
+        if self.listeners:
+            self._emit('error', {'error': error, 'timeout': timeout, 'bytes': size, 'seconds': seconds})
+
+    def snapshot(self, transport=None):
+        """
+        Current values of the counters and histograms.
+        :param transport: also report the transfer count of this transport
+        """
+        with self._lock:
+            snapshot = {
+                'errors': self.errors,
+                'timeouts': self.timeouts}
+        with self.write_seconds._lock:
+            snapshot.update(writes=self.writes, bytes=self.bytes)
+        with self.job_seconds._lock:
+            snapshot['jobs'] = self.jobs
+        if transport is not None:
+            snapshot['transfers'] = transport.transfer_count
+        snapshot['write_seconds'] = self.write_seconds.snapshot()
+        snapshot['job_seconds'] = self.job_seconds.snapshot()
+        snapshot['encode_seconds'] = ENCODE_TIMES.snapshot()
+        return snapshot
@@ -0,0 +1,136 @@
+"""
+Encode a directory of images into job files, ready to be printed without being encoded again:
+
+    python -m epson_printer.precompile --mode raster --dither atkinson coupons/ jobs/
+
+Images are encoded in parallel by a pool of processes, one per core by default. Every image gives
+a .escpos file holding its ESC/POS payload behind a header (see PrintableImage.save), printed with
+EpsonPrinter.print_job_file. Job files whose source image did not change are kept as they are.
+"""
+from __future__ import print_function
+import hashlib
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from optparse import OptionParser
+from .epsonprinter import PrintableImage, open_image, read_job_header, COLUMN_MODE, RASTER_MODE
+from .profiles import get_profile, PROFILES
+
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp')
+JOB_EXTENSION = '.escpos'
+
+
+def job_path(source, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(source))[0] + JOB_EXTENSION)
+
+
+def params_hash(mode, dither, compact, rotate, profile):
+    """ SHA-256 digest of the parameters of encode_file, stored in the job files """
+    params = (mode, dither, compact, rotate, profile.width, profile.density)
+    return hashlib.sha256(repr(params).encode('utf-8')).digest()
+
+
+def is_up_to_date(path, source_hash, params_hash=None, mode=None, width=None):
+    """
+    Whether the job file exists, has the current format and was encoded from the same source, with the same
+    parameters, in mode and at most width dots wide
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = read_job_header(f)
+    except (IOError, ValueError):
+        return False
+    return (header.source_hash == source_hash
+            and (params_hash is None or header.params_hash == params_hash)
+            and (mode is None or header.mode == mode)
+            and (width is None or header.width <= width))
+
+
+def encode_file(source, output, mode=COLUMN_MODE, dither=None, compact=False, rotate=False, force=False,
+                profile=None):
+    """
+    Encode an image file into a job file, run in the worker processes
+    :param profile: name of the PrinterProfile giving the width of the images, see epson_printer.profiles
+    :return: the size of the job payload, None if the job file was up to date
+    """
+    profile = get_profile(profile)
+    with open(source, 'rb') as f:
+        data = f.read()
+    source_hash = hashlib.sha256(data).digest()
+    params = params_hash(mode, dither, compact, rotate, profile)
+    width = profile.column_width if mode == COLUMN_MODE else profile.width
+    if not force and is_up_to_date(output, source_hash, params, mode, width):
+        return None
+    image = open_image(io.BytesIO(data), profile.width)
+    if rotate:
+        image = image.rotate(180)
+    printable_image = PrintableImage.from_image(image, mode, dither=dither, compact=compact, profile=profile)
+    # Readers never see a partially written job, and writers never share a partial file
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(output) or '.', suffix='.partial')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            printable_image.save(f, source_hash, params)
+        os.replace(partial, output)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return printable_image.size
+
+
+def precompile(source_dir, output_dir, mode=COLUMN_MODE, dither=None, compact=False, rotate=False, force=False,
+               jobs=None, profile=None):
+    """
+    Encode all the images of source_dir into job files in output_dir. Raises ValueError if several images
+    would give the same job file, such as logo.png and logo.jpg
+    :param jobs: number of processes, one per core if None
+    :return: a dict mapping the source paths to the size of their payload, None for the ones up to date
+    """
+    sources = sorted(os.path.join(source_dir, name) for name in os.listdir(source_dir)
+                     if name.lower().endswith(IMAGE_EXTENSIONS))
+    outputs = {}
+    for source in sources:
+        output = job_path(source, output_dir)
+        if output in outputs:
+            raise ValueError("%s and %s would both be encoded into %s" % (outputs[output], source, output))
+        outputs[output] = source
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(encode_file, source, job_path(source, output_dir), mode, dither, compact, rotate,
+                                   force, profile)
+                   for source in sources]
+        return dict((source, future.result()) for source, future in zip(sources, futures))
+
+
+def main(args=None):
+    parser = OptionParser(usage="%prog [options] SOURCE_DIR OUTPUT_DIR")
+    parser.add_option("-m", "--mode", action="store", type="choice", choices=[COLUMN_MODE, RASTER_MODE],
+                      dest="mode", default=COLUMN_MODE, help="Image encoding mode, column or raster")
+    parser.add_option("-d", "--dither", action="store", type="string", dest="dither",
+                      help="Dithering method, see epson_printer.dithering")
+    parser.add_option("-c", "--compact", action="store_true", dest="compact", default=False,
+                      help="Skip the white parts of the images")
+    parser.add_option("-r", "--rotate", action="store_true", dest="rotate", default=False,
+                      help="Rotate the images by 180 degrees")
+    parser.add_option("-f", "--force", action="store_true", dest="force", default=False,
+                      help="Encode the images again even if their job files are up to date")
+    parser.add_option("-p", "--profile", action="store", type="choice", choices=sorted(PROFILES),
+                      dest="profile", help="Printer profile giving the width of the images, see epson_printer.profiles")
+    parser.add_option("-j", "--jobs", action="store", type="int", dest="jobs",
+                      help="Number of processes, one per core by default")
+    options, args = parser.parse_args(args)
+    if len(args) != 2:
+        parser.print_help()
+        return 2
+
+    results = precompile(args[0], args[1], options.mode, options.dither, options.compact, options.rotate,
+                         options.force, options.jobs, options.profile)
+    for source, size in sorted(results.items()):
+        print("%-40s %s" % (os.path.basename(source), "up to date" if size is None else "%d bytes" % size))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
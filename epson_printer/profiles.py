@@ -0,0 +1,89 @@
+"""
+What the printer models can print: paper width in dots, bit image density, maximum transfer size and
+the ESC/POS command sets they understand.
+
+    printer = EpsonPrinter(0x04b8, 0x0e15, profile='58mm')
+    logo = PrintableImage.from_image(Image.open('logo.png'), profile='58mm')
+
+Images are resized once to the width of the profile, so that no dot falling off the paper is
+encoded or sent. The default profile is the one of 80 mm printers such as the TM-T20, 512 dots wide.
+Other models are described with a PrinterProfile.
+"""
+from .codepages import DEFAULT_CODE_PAGES
+
+# ESC * densities of the 24-dot column mode
+SINGLE_DENSITY = 32  # 90 dpi horizontally, every column is printed two dots wide
+DOUBLE_DENSITY = 33  # 180 dpi
+
+# Command sets
+PAGE_MODE = 'page_mode'      # ESC L, ESC W, FF
+RASTER = 'raster'            # GS v 0
+GRAPHICS = 'graphics'        # GS ( L / GS 8 L, FS q / FS p
+BARCODES = 'barcodes'        # GS k
+CODES_2D = '2d_codes'        # GS ( k
+STATUS = 'status'            # DLE EOT, GS a
+ALL_COMMANDS = frozenset([PAGE_MODE, RASTER, GRAPHICS, BARCODES, CODES_2D, STATUS])
+
+
+class PrinterProfile(object):
+    """ Capabilities of a printer model """
+
+    __slots__ = ('name', 'width', 'page_x', 'density', 'max_transfer', 'commands', 'code_pages')
+
+    def __init__(self, name, width=512, page_x=46, density=DOUBLE_DENSITY, max_transfer=None,
+                 commands=ALL_COMMANDS, code_pages=DEFAULT_CODE_PAGES):
+        """
+        @param name         : Name of the profile
+        @param width        : Printable width in dots
+        @param page_x       : Horizontal origin of the page mode print area, in motion units
+        @param density      : ESC * density of column mode images, SINGLE_DENSITY or DOUBLE_DENSITY
+        @param max_transfer : Maximum size of a single USB transfer, 64 packets of the end point if None
+        @param commands     : Supported command sets
+        @param code_pages   : Supported code pages by order of preference, see epson_printer.codepages
+        """
+        if density not in (SINGLE_DENSITY, DOUBLE_DENSITY):
+            raise ValueError("Unknown column density: %s" % density)
+        self.name = name
+        self.width = width
+        self.page_x = page_x
+        self.density = density
+        self.max_transfer = max_transfer
+        self.commands = frozenset(commands)
+        self.code_pages = tuple(code_pages)
+
+    @property
+    def column_width(self):
+        """ Number of ESC * columns across the paper """
+        return self.width if self.density == DOUBLE_DENSITY else self.width // 2
+
+    def supports(self, command):
+        return command in self.commands
+
+    def require(self, command):
+        """ Raise ValueError if the printer does not understand a command set """
+        if command not in self.commands:
+            raise ValueError("%s printers do not support %s commands" % (self.name, command))
+
+    def __repr__(self):
+        return "PrinterProfile(%r, width=%d)" % (self.name, self.width)
+
+
+DEFAULT_PROFILE = PrinterProfile('default')
+
+PROFILES = dict((profile.name, profile) for profile in [
+    DEFAULT_PROFILE,
+    PrinterProfile('80mm'),
+    PrinterProfile('58mm', width=384, page_x=0),
+])
+
+
+def get_profile(profile):
+    """ A PrinterProfile, from a profile, its name in PROFILES, or None for the default profile """
+    if profile is None:
+        return DEFAULT_PROFILE
+    if isinstance(profile, PrinterProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError("Unknown printer profile: %s" % profile)
@@ -0,0 +1,230 @@
+"""
+Print spooler for a pool of printers.
+
+Each printer gets its own worker thread consuming a bounded priority queue. Jobs are routed to
+the least loaded printer unless a printer is named, and failed transfers are retried:
+
+    spooler = Spooler([EpsonPrinter(0x04b8, 0x0e03), EpsonPrinter(transport=TcpTransport('till-2'))])
+    spooler.submit(lambda printer: printer.print_text("Hello"), priority=1)
+    spooler.submit_image(Image.open('coupon.png'))
+    spooler.close()
+
+A job is a callable receiving the EpsonPrinter it runs on. Everything it writes is sent as one
+print job. Image encoding runs in a separate executor so that converting an image overlaps with
+the transfers of the other printers.
+
+When a printer reports that it is offline (PrinterOfflineError, see transport.StatusAwareTransport),
+its job is moved to another printer and no job is routed to it for a while.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from .epsonprinter import PrintableImage, COLUMN_MODE
+from .status import PrinterOfflineError
+
+logger = logging.getLogger(__name__)
+
+# usb.core.USBError and socket errors are both IOError subclasses
+RETRY_ERRORS = (IOError,)
+
+
+class SpoolJob(object):
+    """ A job waiting in a printer queue """
+
+    def __init__(self, func, priority=0, pinned=False):
+        self.func = func
+        self.priority = priority
+        # Whether the job was submitted to a given printer, it is not moved to another one then
+        self.pinned = pinned
+        self.future = Future()
+        self.attempts = 0
+
+
+class _Worker(threading.Thread):
+    """ Runs the jobs of a single printer """
+
+    def __init__(self, spooler, printer, queue_size):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.spooler = spooler
+        self.printer = printer
+        self.queue = queue.PriorityQueue(queue_size)
+        # Jobs queued or running
+        self.load = 0
+        self.lock = threading.Lock()
+        # time.time() until which the printer is considered offline
+        self.offline_until = 0
+
+    def put(self, job, timeout=None, block=True):
+        with self.lock:
+            self.load += 1
+        try:
+            self.queue.put((-job.priority, next(self.spooler._sequence), job), block, timeout)
+        except queue.Full:
+            with self.lock:
+                self.load -= 1
+            raise
+
+    def run(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                break
+            try:
+                self.spooler._run(job, self)
+            finally:
+                with self.lock:
+                    self.load -= 1
+
+
+class Spooler(object):
+    """ Dispatches print jobs to a pool of printers """
+
+    def __init__(self, printers, queue_size=16, retries=3, retry_delay=0.5, encoder=None, offline_delay=30):
+        """
+        @param printers    : The EpsonPrinter instances of the pool
+        @param queue_size  : Maximum number of jobs waiting for each printer. submit blocks when the queue is full
+        @param retries     : Number of times a job is retried after an IOError (USBError, socket error)
+        @param retry_delay : Delay between two attempts, in seconds
+        @param encoder     : Executor encoding images, a thread pool by default. A ProcessPoolExecutor can be
+                             given to spread the conversion over several cores
+        @param offline_delay : Time during which no job is routed to a printer that reported being offline,
+                               in seconds
+        """
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.offline_delay = offline_delay
+        self.encoder = encoder or ThreadPoolExecutor()
+        self._sequence = itertools.count()
+        self.workers = [_Worker(self, printer, queue_size) for printer in printers]
+        for worker in self.workers:
+            worker.start()
+
+    def _worker(self, printer):
+        if printer is None:
+            return min(self._online(self.workers) or self.workers, key=lambda worker: worker.load)
+        for worker in self.workers:
+            if worker.printer is printer:
+                return worker
+        raise ValueError("Printer is not part of the pool")
+
+    def submit(self, func, priority=0, printer=None, timeout=None):
+        """
+        Queue a job.
+        :param func: callable receiving the EpsonPrinter the job runs on
+        :param priority: jobs with a higher priority are printed first
+        :param printer: the printer to use, the least loaded online one if None
+        :param timeout: maximum time to wait for room in the queue, queue.Full is raised after that
+        :return: a Future of the value returned by func
+        """
+        job = SpoolJob(func, priority, printer is not None)
+        self._worker(printer).put(job, timeout)
+        return job.future
+
+    def submit_image(self, image, priority=0, printer=None, mode=COLUMN_MODE, dither=None, compact=False,
+                     profile=None):
+        """
+        Encode a PIL image in the encoder executor, then queue a job printing it. mode, dither, compact and
+        profile are passed to PrintableImage.from_image. The profile defaults to the one of the printer, or to
+        the narrowest profile of the spooler printers when the job may go to any of them.
+        :return: a Future resolved once the image is printed
+        """
+        future = Future()
+        if profile is None:
+            printers = [printer] if printer is not None else [worker.printer for worker in self.workers]
+            profile = min((p.profile for p in printers), key=lambda p: p.width)
+
+        def encoded(encoding):
+            if encoding.exception() is not None:
+                future.set_exception(encoding.exception())
+                return
+            printable_image = encoding.result()
+            try:
+                job = self.submit(lambda p: p.print_image(printable_image), priority, printer)
+            except Exception as e:
+                future.set_exception(e)
+                return
+            job.add_done_callback(lambda done: _copy_future(done, future))
+
+        task = self.encoder.submit(PrintableImage.from_image, image, mode, dither=dither, compact=compact,
+                                   profile=profile)
+        task.add_done_callback(encoded)
+        return future
+
+    def _run(self, job, worker):
+        # Jobs moved from an offline printer are already running
+        if not job.future.running() and not job.future.set_running_or_notify_cancel():
+            return
+        printer = worker.printer
+        while True:
+            try:
+                with printer.job():
+                    result = job.func(printer)
+            except PrinterOfflineError as e:
+                worker.offline_until = time.time() + self.offline_delay
+                job.attempts += 1
+                if job.attempts > self.retries:
+                    job.future.set_exception(e)
+                    return
+                if not job.pinned and self._reroute(job, worker):
+                    return
+                time.sleep(self.retry_delay)
+            except RETRY_ERRORS as e:
+                job.attempts += 1
+                if job.attempts > self.retries:
+                    job.future.set_exception(e)
+                    return
+                time.sleep(self.retry_delay)
+            except Exception as e:
+                job.future.set_exception(e)
+                return
+            else:
+                job.future.set_result(result)
+                return
+
+    @staticmethod
+    def _online(workers):
+        now = time.time()
+        return [worker for worker in workers if worker.offline_until <= now]
+
+    def _reroute(self, job, worker):
+        """ Move a job to another online printer, False if there is none with room for it """
+        others = self._online(other for other in self.workers if other is not worker)
+        if not others:
+            return False
+        other = min(others, key=lambda other: other.load)
+        try:
+            other.put(job, block=False)
+        except queue.Full:
+            return False
+        logger.warning("Printer offline, job moved to another printer: %s", worker.printer)
+        return True
+
+    def close(self, wait=True):
+        """ Stop the workers once their queues are empty """
+        # Images being encoded are queued before the workers are told to stop
+        self.encoder.shutdown(wait=wait)
+        for worker in self.workers:
+            # Sorts after every job, whatever its priority
+            worker.queue.put((float('inf'), next(self._sequence), None))
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _copy_future(source, target):
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,136 @@
+"""
+Status of the printers, read back with the real-time DLE EOT command or sent automatically (ASB).
+
+    status = printer.query_status()
+    if status.paper_out:
+        ...
+
+DLE EOT is executed as soon as it is received, even when the printer is offline or its receive
+buffer is full, so that a query answers within a few milliseconds. See
+transport.StatusAwareTransport to check the status before sending data.
+"""
+DLE = 16
+EOT = 4
+GS = 29
+
+# DLE EOT n
+PRINTER_STATUS = 1
+OFFLINE_STATUS = 2
+ERROR_STATUS = 3
+PAPER_STATUS = 4
+
+# GS a n, the statuses automatically sent when they change
+ASB_DRAWER = 1
+ASB_ONLINE = 2
+ASB_ERROR = 4
+ASB_PAPER = 8
+
+
+class PrinterStatusError(IOError):
+    """ A printer cannot print, status is the PrinterStatus that tells why, None if it did not reply """
+
+    def __init__(self, message, status=None):
+        IOError.__init__(self, message)
+        self.status = status
+
+
+class PrinterOfflineError(PrinterStatusError):
+    """ The printer is offline: no paper, cover open, error, or no reply to the status queries """
+
+
+class PrinterBusyError(PrinterStatusError):
+    """ The printer is online but stopped accepting data before the write timeout, its receive buffer is full """
+
+
+def transmit_status(n):
+    return [
+        DLE,
+        EOT,
+        n]
+
+
+def enable_asb(flags=ASB_ONLINE | ASB_ERROR | ASB_PAPER):
+    return [
+        GS,
+        97,  # a
+        flags]
+
+
+class PrinterStatus(object):
+    """ What a printer reported about itself """
+
+    __slots__ = ('online', 'cover_open', 'paper_out', 'paper_near_end', 'error', 'feeding')
+
+    def __init__(self, online=True, cover_open=False, paper_out=False, paper_near_end=False, error=False,
+                 feeding=False):
+        self.online = online
+        self.cover_open = cover_open
+        self.paper_out = paper_out
+        self.paper_near_end = paper_near_end
+        self.error = error
+        self.feeding = feeding
+
+    @classmethod
+    def from_dle_eot(cls, printer, offline, paper):
+        """
+        Parse the replies to DLE EOT 1, 2 and 4
+        """
+        for byte in (printer, offline, paper):
+            # Bits 1 and 4 are always set, bits 0 and 7 never
+            if byte & 0x93 != 0x12:
+                raise ValueError("Malformed status byte: 0x%02x" % byte)
+        return cls(
+            online=not printer & 0x08,
+            cover_open=bool(offline & 0x04),
+            paper_out=bool(offline & 0x20 or paper & 0x60),
+            paper_near_end=bool(paper & 0x0c),
+            error=bool(offline & 0x40),
+            feeding=bool(offline & 0x08))
+
+    @classmethod
+    def from_asb(cls, data):
+        """
+        Parse the 4 bytes of an automatic status back
+        """
+        data = bytearray(data)
+        if len(data) != 4 or data[0] & 0x93 != 0x10:
+            raise ValueError("Malformed automatic status")
+        return cls(
+            online=not data[0] & 0x08,
+            cover_open=bool(data[0] & 0x20),
+            paper_out=bool(data[2] & 0x0c),
+            paper_near_end=bool(data[2] & 0x03),
+            error=bool(data[1] & 0x6c),
+            feeding=bool(data[0] & 0x40))
+
+    @property
+    def ready(self):
+        """ Whether the printer can print now """
+        return self.online and not (self.cover_open or self.paper_out or self.error)
+
+    def __eq__(self, other):
+        return isinstance(other, PrinterStatus) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "PrinterStatus(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+
+
+def query_status(transport, timeout=1.0):
+    """
+    Query the status of a printer with DLE EOT
+    :param transport: a transport able to read from the printer
+    :param timeout: maximum time to wait for each reply, in seconds
+    :return: a PrinterStatus. PrinterOfflineError is raised if the printer does not reply
+    """
+    replies = bytearray()
+    for n in (PRINTER_STATUS, OFFLINE_STATUS, PAPER_STATUS):
+        transport.write(bytearray(transmit_status(n)))
+        reply = transport.read(1, timeout)
+        if not reply:
+            raise PrinterOfflineError("No reply to the status query")
+        replies += reply
+    return PrinterStatus.from_dle_eot(*replies)
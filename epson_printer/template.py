@@ -0,0 +1,146 @@
+"""
+Receipt templates compiled once and rendered by joining byte segments.
+
+    def layout(receipt):
+        receipt.print_image(logo)
+        receipt.center()
+        receipt.field('store')
+        receipt.linefeed()
+        receipt.left_justified()
+        receipt.field('items')
+        receipt.bold_on()
+        receipt.field('total')
+        receipt.bold_off()
+        receipt.linefeed(4)
+        receipt.cut()
+
+    template = compile_template(layout)
+    printer.print_template(template, store="Main street", items=["2 x Coffee  5.00\\n", ...], total="5.00")
+
+The layout calls the usual EpsonPrinter methods once, at compile time. Their commands are frozen into
+immutable segments between the named fields, so rendering a receipt only encodes the field values and
+joins them with the segments, whatever the number of commands of the layout.
+"""
+from .codepages import TextEncoder, CODE_PAGES, select_code_page
+from .epsonprinter import EpsonPrinter
+from .transport import MemoryTransport
+
+
+class Template(object):
+    """ Alternating byte segments and field names, see compile_template """
+
+    __slots__ = ('segments', 'fields', 'encoding', 'code_pages', 'code_page')
+
+    def __init__(self, segments, fields, encoding='cp437', code_pages=None, code_page=None):
+        """
+        @param segments   : len(fields) + 1 bytes objects, written before, between and after the fields
+        @param fields     : Field names
+        @param encoding   : Encoding of the text values, also the code page the printer shows before the
+                            first segment when it is one of epson_printer.codepages
+        @param code_pages : Code page the printer shows at each field, encoding at all of them if None
+        @param code_page  : Code page the printer shows after the last segment, the last of code_pages if None
+        """
+        if len(segments) != len(fields) + 1:
+            raise ValueError("A template has one segment more than fields")
+        if encoding not in CODE_PAGES:
+            code_pages = code_page = None
+        else:
+            code_pages = tuple(code_pages or [encoding] * len(fields))
+            if len(code_pages) != len(fields):
+                raise ValueError("A template has one code page per field")
+            code_page = code_page or (code_pages[-1] if code_pages else encoding)
+        object.__setattr__(self, 'segments', tuple(bytes(segment) for segment in segments))
+        object.__setattr__(self, 'fields', tuple(fields))
+        object.__setattr__(self, 'encoding', encoding)
+        object.__setattr__(self, 'code_pages', code_pages)
+        object.__setattr__(self, 'code_page', code_page)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Templates are immutable")
+
+    def __reduce__(self):
+        return Template, (self.segments, self.fields, self.encoding, self.code_pages, self.code_page)
+
+    def render(self, **values):
+        """
+        The buffers of a receipt, to be given to EpsonPrinter.writev.
+        A value is text, bytes (e.g. commands), or a list of those written one after the other.
+        """
+        return self.render_values(values)
+
+    def render_values(self, values, text_encoder=None):
+        """
+        render with the values in a dict. When the encoding is a code page, text values are encoded with
+        text_encoder (a TextEncoder over the default code pages if None) from the page shown at their field,
+        and that page is selected again after them for the following segment.
+        """
+        if self.code_pages is not None and text_encoder is None:
+            text_encoder = TextEncoder()
+        buffers = [self.segments[0]]
+        for index, (field, segment) in enumerate(zip(self.fields, self.segments[1:])):
+            try:
+                value = values[field]
+            except KeyError:
+                raise ValueError("Missing value of template field %s" % field)
+            items = value if isinstance(value, (list, tuple)) else [value]
+            if self.code_pages is None:
+                buffers.extend(self._encode(item) for item in items)
+            else:
+                code_page = self.code_pages[index]
+                current = code_page
+                for item in items:
+                    if isinstance(item, (bytes, bytearray, memoryview)):
+                        buffers.append(item)
+                    else:
+                        data, current = text_encoder.encode('%s' % item, current)
+                        buffers.append(data)
+                if current != code_page:
+                    buffers.append(bytes(bytearray(select_code_page(code_page))))
+            buffers.append(segment)
+        return buffers
+
+    def _encode(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return ('%s' % value).encode(self.encoding)
+
+
+class TemplateBuilder(object):
+    """
+    Records the commands of an EpsonPrinter into a Template. Every printer method can be called on
+    the builder, field(name) marks where a value is written when the template is rendered.
+    """
+
+    def __init__(self, encoding='cp437', profile=None):
+        self.encoding = encoding
+        self._recorder = MemoryTransport()
+        self._printer = EpsonPrinter(transport=self._recorder, encoding=encoding, profile=profile)
+        self._segments = []
+        self._fields = []
+        self._code_pages = []
+
+    def __getattr__(self, name):
+        return getattr(self._printer, name)
+
+    def field(self, name):
+        self._segments.append(self._recorder.getvalue())
+        self._recorder.transfers = []
+        self._fields.append(name)
+        self._code_pages.append(self._printer.code_page)
+
+    def build(self):
+        return Template(self._segments + [self._recorder.getvalue()], self._fields, self.encoding,
+                        self._code_pages, self._printer.code_page)
+
+
+def compile_template(layout, encoding='cp437', profile=None):
+    """
+    Compile a receipt layout
+    :param layout: a callable receiving a TemplateBuilder, calling printer methods and field() on it
+    :param encoding: encoding of the text of the layout and of the field values
+    :param profile: PrinterProfile of the printers the receipts are printed on, see epson_printer.profiles
+    :return: a Template
+    """
+    builder = TemplateBuilder(encoding, profile)
+    layout(builder)
+    return builder.build()
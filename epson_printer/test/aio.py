@@ -0,0 +1,148 @@
+import asyncio
+import gc
+import logging
+import unittest
+from PIL import Image
+from ..aio import AsyncEpsonPrinter, AsyncTransport
+from ..epsonprinter import EpsonPrinter
+from ..transport import MemoryTransport
+
+
+class SlowTransport(AsyncTransport):
+
+    def __init__(self):
+        self.transfers = []
+
+    async def writev(self, buffers):
+        await asyncio.sleep(0.01)
+        self.transfers.append(b''.join(buffers))
+
+
+class TestAsyncEpsonPrinter(unittest.TestCase):
+
+    def run_async(self, coroutine):
+        return asyncio.new_event_loop().run_until_complete(coroutine)
+
+    def test_commands(self):
+        device = MemoryTransport()
+
+        async def main():
+            printer = AsyncEpsonPrinter(device)
+            await printer.print_text("Hello")
+            await printer.linefeed()
+            async with printer.job():
+                await printer.bold_on()
+                await printer.print_text("Total")
+                await printer.bold_off()
+            await printer.close()
+
+        self.run_async(main())
+        self.assertEqual(device.transfers, [b'Hello', b'\x1bd\x01', b'\x1bE\x01Total\x1bE\x00'])
+
+    def test_offloaded_code_page(self):
+        device = MemoryTransport()
+
+        async def main():
+            printer = AsyncEpsonPrinter(device)
+            printer.OFFLOADED = AsyncEpsonPrinter.OFFLOADED + ('print_text',)
+            # The page is switched on the loop while the text is encoded in the executor
+            await asyncio.gather(printer.print_text(u'5€'), printer.set_code_page('cp866'))
+            await printer.close()
+            return printer
+
+        printer = self.run_async(main())
+        self.assertEqual(device.transfers, [b'\x1bt\x11', b'\x1bt\x005\x1bt\x13\xd5'])
+        self.assertEqual(printer.code_page, 'cp858')
+
+    def test_cancelled_flush(self):
+        device = SlowTransport()
+
+        async def main():
+            printer = AsyncEpsonPrinter(device)
+            task = asyncio.ensure_future(printer.print_text("first"))
+            await asyncio.sleep(0.001)
+            task.cancel()
+            await printer.print_text("second")
+            await printer.close()
+            return task
+
+        task = self.run_async(main())
+        self.assertTrue(task.cancelled())
+        # the cancelled write still went out entirely, before the next one
+        self.assertEqual(device.transfers, [b'first', b'second'])
+
+    def test_print_image_stream(self):
+        image = Image.open('logo.png')
+        device = MemoryTransport()
+
+        async def main():
+            printer = AsyncEpsonPrinter(device)
+            await printer.print_image_stream(image, band_height=48)
+            with self.assertRaises(ValueError):
+                await printer.print_image_stream(image, band_height=30)
+            await printer.print_text_image(u'ab')
+            await printer.close()
+
+        self.run_async(main())
+        expected = MemoryTransport()
+        EpsonPrinter(transport=expected).print_image_stream(image, band_height=48)
+        EpsonPrinter(transport=expected).print_text_image(u'ab')
+        self.assertEqual(device.getvalue(), expected.getvalue())
+        # the bands were sent one by one
+        self.assertEqual(len(device.transfers), len(expected.transfers))
+
+    def test_cancelled_stream(self):
+        device = SlowTransport()
+        records = []
+        handler = logging.Handler(logging.WARNING)
+        handler.emit = records.append
+        logging.getLogger().addHandler(handler)
+
+        async def main():
+            printer = AsyncEpsonPrinter(device)
+            task = asyncio.ensure_future(printer.print_image_stream(Image.open('logo.png')))
+            await asyncio.sleep(0.025)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # Let the encoding thread notice
+            await asyncio.sleep(0.2)
+            await printer.close()
+            return printer
+
+        try:
+            printer = self.run_async(main())
+            gc.collect()
+        finally:
+            logging.getLogger().removeHandler(handler)
+        # Neither an unretrieved exception nor a transport error was reported
+        self.assertEqual([record.getMessage() for record in records], [])
+        self.assertEqual(printer.get_stats()['errors'], 0)
+        self.assertLess(len(device.transfers), 9)
+
+    def test_tcp(self):
+        received = []
+
+        async def main():
+            done = asyncio.Event()
+
+            async def handle(reader, writer):
+                received.append(await reader.read())
+                writer.close()
+                done.set()
+
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            printer = await AsyncEpsonPrinter.connect_tcp('127.0.0.1', port)
+            await printer.print_text("Hello")
+            await printer.cut()
+            await printer.close()
+            await done.wait()
+            server.close()
+
+        self.run_async(main())
+        self.assertEqual(received, [b'Hello\x1dV\x00'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from ..epsonprinter import EpsonPrinter, barcode, qr_code, pdf417, HRI_NONE
+from ..transport import MemoryTransport
+
+
+class TestBarcodes(unittest.TestCase):
+
+    def test_barcode(self):
+        self.assertEqual(barcode('4006381333931', 'EAN13', height=80, module_width=2, hri=HRI_NONE),
+                         b'\x1dhP\x1dw\x02\x1dH\x00\x1df\x00\x1dkC\x0d4006381333931')
+
+    def test_code128_code_set(self):
+        self.assertEqual(barcode('No. 42')[-12:], b'\x1dkI\x08{BNo. 42')
+        self.assertEqual(barcode(b'{C\x0c\x22')[-8:], b'\x1dkI\x04{C\x0c\x22')
+
+    def test_barcode_errors(self):
+        self.assertRaises(ValueError, barcode, '123', 'QR')
+        self.assertRaises(ValueError, barcode, '123', module_width=7)
+        self.assertRaises(ValueError, barcode, 'x' * 254)
+        self.assertRaises(ValueError, barcode, u'caf\xe9')
+
+    def test_qr_code(self):
+        self.assertEqual(qr_code(u'https://example.com/r/42', module_size=6, error_correction='Q'),
+                         b'\x1d(k\x04\x001A2\x00' +
+                         b'\x1d(k\x03\x001C\x06' +
+                         b'\x1d(k\x03\x001E2' +
+                         b'\x1d(k\x1b\x001P0https://example.com/r/42' +
+                         b'\x1d(k\x03\x001Q0')
+        self.assertRaises(ValueError, qr_code, 'x', error_correction='X')
+        self.assertRaises(ValueError, qr_code, 'x', module_size=17)
+        self.assertRaises(ValueError, qr_code, '')
+
+    def test_large_qr_code(self):
+        command = qr_code(b'x' * 300)
+        self.assertEqual(command[25:33], b'\x1d(k\x2f\x011P0')
+
+    def test_pdf417(self):
+        self.assertEqual(pdf417(b'ticket', columns=4, error_correction=2, truncated=True),
+                         b'\x1d(k\x03\x000A\x04' +
+                         b'\x1d(k\x03\x000B\x00' +
+                         b'\x1d(k\x03\x000C\x03' +
+                         b'\x1d(k\x03\x000D\x03' +
+                         b'\x1d(k\x04\x000E02' +
+                         b'\x1d(k\x03\x000F\x01' +
+                         b'\x1d(k\x09\x000P0ticket' +
+                         b'\x1d(k\x03\x000Q0')
+        self.assertRaises(ValueError, pdf417, 'x', rows=2)
+
+    def test_printer_methods(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        printer.qr_code('42')
+        printer.barcode('42', 'ITF')
+        self.assertEqual(device.transfers, [qr_code('42'), barcode('42', 'ITF')])
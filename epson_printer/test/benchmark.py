@@ -0,0 +1,18 @@
+import json
+import unittest
+from ..benchmark import run_suite, format_results
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run_suite(self):
+        suite = json.loads(json.dumps(run_suite(repeat=1, quick=True)))
+        self.assertIn('from_image/column/200x209', suite['results'])
+        self.assertIn('receipt/2', suite['results'])
+        for result in suite['results'].values():
+            self.assertGreater(result['items_per_s'], 0)
+        self.assertIn('1.00x', format_results(suite, suite))
+
+
+if __name__ == '__main__':
+    unittest.main()
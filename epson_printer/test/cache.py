@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+import unittest
+from ..cache import ImageCache, _param
+from ..dithering import atkinson, floyd_steinberg, threshold
+from ..epsonprinter import EpsonPrinter, PrintableImage
+from ..profiles import PrinterProfile
+from ..transport import MemoryTransport
+
+
+class TestImageCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = ImageCache(max_bytes=10)
+        cache.put('a', PrintableImage(b'x' * 4, 48))
+        cache.put('b', PrintableImage(b'x' * 4, 48))
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', PrintableImage(b'x' * 4, 48))
+        # b was the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'hits': 2, 'disk_hits': 0, 'misses': 1, 'entries': 2, 'bytes': 8})
+
+    def test_copies(self):
+        cache = ImageCache()
+        printable_image = PrintableImage(b'x' * 4, 48)
+        cache.put('a', printable_image)
+        printable_image.append(PrintableImage(b'y' * 4, 48))
+        cache.get('a').append(PrintableImage(b'z' * 4, 48))
+        self.assertEqual((cache.get('a').data, cache.get('a').height), (b'x' * 4, 48))
+        self.assertEqual(cache.stats()['bytes'], 4)
+
+    def test_key(self):
+        self.assertEqual(ImageCache.key(b'png', rotate=False, mode='column'),
+                         ImageCache.key(b'png', mode='column', rotate=False))
+        self.assertNotEqual(ImageCache.key(b'png', rotate=False), ImageCache.key(b'png', rotate=True))
+        self.assertNotEqual(ImageCache.key(b'png', rotate=False), ImageCache.key(b'jpg', rotate=False))
+        # Functions are keyed by name, profiles by the fields changing the images
+        self.assertEqual(_param(floyd_steinberg), ('function', 'epson_printer.dithering', 'floyd_steinberg'))
+        self.assertNotEqual(ImageCache.key(b'png', dither=floyd_steinberg), ImageCache.key(b'png', dither=atkinson))
+        self.assertIsNone(ImageCache.key(b'png', dither=lambda gray: threshold(gray)))
+        self.assertEqual(ImageCache.key(b'png', profile=PrinterProfile('custom', width=400)),
+                         ImageCache.key(b'png', profile=PrinterProfile('other', width=400)))
+        self.assertNotEqual(ImageCache.key(b'png', profile=PrinterProfile('custom', width=400)),
+                            ImageCache.key(b'png', profile=PrinterProfile('custom', width=384)))
+
+    def test_disk(self):
+        directory = tempfile.mkdtemp()
+        try:
+            ImageCache(directory=directory).put('a', PrintableImage(b'\x01\x02', 5, 'raster'))
+            cache = ImageCache(directory=directory)
+            printable_image = cache.get('a')
+            self.assertEqual((printable_image.data, printable_image.height, printable_image.mode),
+                             (b'\x01\x02', 5, 'raster'))
+            self.assertEqual(cache.stats()['disk_hits'], 1)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_printer(self):
+        cache = ImageCache()
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device, image_cache=cache)
+        printer.print_image_from_file('logo.png')
+        printer.print_image_from_file('logo.png')
+        printer.print_image_from_file('logo.png', rotate=True)
+        self.assertEqual(device.transfers[0], device.transfers[1])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+        # Lambdas are not cached
+        printer.print_image_from_file('logo.png', dither=lambda gray: threshold(gray))
+        self.assertEqual(cache.stats()['entries'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
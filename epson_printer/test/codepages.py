@@ -0,0 +1,58 @@
+import unittest
+from ..codepages import TextEncoder, get_code_page, glyph_bitmap
+from ..epsonprinter import EpsonPrinter
+from ..transport import MemoryTransport
+
+
+class TestTextEncoder(unittest.TestCase):
+
+    def test_tables(self):
+        self.assertEqual(get_code_page('cp858').table[u'€'], 0xd5)
+        self.assertEqual(get_code_page('katakana').table[u'ｶ'], 0xb6)
+        # Full width katakana are printed with their half width form
+        self.assertEqual(get_code_page('katakana').table[u'カ'], 0xb6)
+        self.assertRaises(ValueError, get_code_page, 'cp65001')
+
+    def test_current_page(self):
+        encoder = TextEncoder()
+        self.assertEqual(encoder.encode(u'caf\xe9 cr\xe8me'), (b'caf\x82 cr\x8ame', 'cp437'))
+        self.assertEqual(encoder.encode(u'€5', 'cp1252'), (b'\x805', 'cp1252'))
+        # Decomposed accents are composed first
+        self.assertEqual(encoder.encode(u'cafe\u0301'), (b'caf\x82', 'cp437'))
+
+    def test_switch(self):
+        encoder = TextEncoder()
+        self.assertEqual(encoder.encode(u'Caf\xe9 5€'), (b'Caf\x82 5\x1bt\x13\xd5', 'cp858'))
+        self.assertEqual(encoder.encode(u'При'), (b'\x1bt\x11\x8f\xe0\xa8', 'cp866'))
+        # The page covering the most of the following text is selected
+        self.assertEqual(encoder.encode(u'Ł€'), (b'\x1bt-\xa3\x80', 'cp1250'))
+        self.assertEqual(TextEncoder(['cp852', 'cp858']).encode(u'Ł€'),
+                         (b'\x1bt\x12\x9d\x1bt\x13\xd5', 'cp858'))
+
+    def test_fallback(self):
+        data, code_page = TextEncoder().encode(u'漢x')
+        glyph = glyph_bitmap(u'漢')
+        self.assertEqual(data, glyph + b'x')
+        self.assertEqual(code_page, 'cp437')
+        self.assertEqual(glyph[:3], b'\x1b*!')
+        self.assertEqual(len(glyph), 5 + 3 * (glyph[3] + 256 * glyph[4]))
+        self.assertIs(glyph_bitmap(u'漢'), glyph)
+        self.assertEqual(TextEncoder(fallback=False).encode(u'漢x'), (b'?x', 'cp437'))
+
+    def test_printer(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        printer.print_text(u'5€')
+        printer.print_text(u'6€')
+        printer.set_code_page('cp437')
+        self.assertEqual(device.transfers, [b'5\x1bt\x13\xd5', b'6\xd5', b'\x1bt\x00'])
+        self.assertEqual(printer.code_page, 'cp437')
+
+        # Other encodings are used as they are
+        device = MemoryTransport()
+        EpsonPrinter(transport=device, encoding='utf-8').print_text(u'5€')
+        self.assertEqual(device.transfers, [b'5\xe2\x82\xac'])
+
+
+if __name__ == '__main__':
+    unittest.main()
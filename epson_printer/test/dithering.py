@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from PIL import Image
+from ..dithering import (Ditherer, adjust, bayer, bayer_matrix, diffuse, threshold, FLOYD_STEINBERG_KERNEL,
+                         ATKINSON_KERNEL)
+from ..epsonprinter import PrintableImage
+
+
+def sequential_diffuse(gray, kernel):
+    """ Textbook pixel by pixel error diffusion """
+    levels = gray.copy()
+    (h, w) = levels.shape
+    white = np.zeros((h, w), dtype=bool)
+    for y in range(h):
+        for x in range(w):
+            white[y, x] = levels[y, x] >= 128
+            error = levels[y, x] - 255. * white[y, x]
+            for dy, dx, weight in kernel:
+                if y + dy < h and 0 <= x + dx < w:
+                    levels[y + dy, x + dx] += error * weight
+    return white
+
+
+class TestDithering(unittest.TestCase):
+
+    def test_diffuse(self):
+        rng = np.random.RandomState(0)
+        for shape in [(1, 1), (1, 9), (9, 1), (17, 23)]:
+            gray = rng.randint(0, 256, shape).astype(np.float64)
+            for kernel in (FLOYD_STEINBERG_KERNEL, ATKINSON_KERNEL):
+                np.testing.assert_array_equal(diffuse(gray, kernel), sequential_diffuse(gray, kernel))
+
+    def test_bayer(self):
+        np.testing.assert_array_equal(bayer_matrix(2) * 4, [[0.5, 2.5], [3.5, 1.5]])
+        # half the dots of a mid gray area are printed
+        self.assertEqual(bayer(np.full((8, 8), 128.)).sum(), 32)
+
+    def test_threshold(self):
+        np.testing.assert_array_equal(threshold(np.array([[0., 127., 128., 255.]])), [[False, False, True, True]])
+
+    def test_adjust(self):
+        gray = np.array([0., 127.5, 255.])
+        np.testing.assert_allclose(adjust(gray, contrast=2.), [0., 127.5, 255.])
+        np.testing.assert_allclose(adjust(gray, gamma=2.), [0., 63.75, 255.])
+
+    def test_from_image(self):
+        image = Image.new('L', (30, 30), 200)
+        printable_image = PrintableImage.from_image(image, dither=Ditherer('threshold'))
+        # all white
+        self.assertEqual(printable_image.data, PrintableImage.from_image(Image.new('1', (30, 30), 1)).data)
+        self.assertEqual(Ditherer('atkinson', gamma=1.4)(image).mode, '1')
+        self.assertRaises(ValueError, Ditherer, 'blue-noise')
+
+
+if __name__ == '__main__':
+    unittest.main()
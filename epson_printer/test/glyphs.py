@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+from ..epsonprinter import EpsonPrinter, PrintableImage
+from ..glyphs import GlyphCache, TextRenderer, render_glyph
+from ..profiles import PrinterProfile
+from ..transport import MemoryTransport
+
+
+class TestGlyphs(unittest.TestCase):
+
+    def test_render_glyph(self):
+        columns = render_glyph(u'l')
+        self.assertEqual(columns.shape[0], 1)
+        self.assertEqual(columns.shape[2], 3)
+        self.assertEqual(render_glyph(u'l', size=40).shape[0], 3)
+        self.assertTrue(columns.any())
+        self.assertFalse(render_glyph(u' ').any())
+
+    def test_cache(self):
+        cache = GlyphCache(max_glyphs=2)
+        a = cache.get(u'a')
+        self.assertIs(cache.get(u'a'), a)
+        cache.get(u'b')
+        cache.get(u'c')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 3, 'glyphs': 2})
+        # 'a' was the least recently used
+        self.assertIsNot(cache.get(u'a'), a)
+        self.assertIsNot(cache.get(u'a', size=30), cache.get(u'a'))
+
+    def test_render(self):
+        cache = GlyphCache()
+        image = TextRenderer(cache=cache).render(u'ab\nc')
+        a, b, c = cache.get(u'a'), cache.get(u'b'), cache.get(u'c')
+        stripes = a.shape[0]
+        width = a.shape[1] + b.shape[1]
+        columns = np.zeros((2 * stripes, width, 3), dtype=np.uint8)
+        columns[:stripes] = np.concatenate([a, b], axis=1)
+        columns[stripes:, :c.shape[1]] = c
+        self.assertEqual((image.width, image.height), (width, 2 * stripes * 48))
+        self.assertEqual(image.data, PrintableImage.from_columns(columns).data)
+
+    def test_wrap(self):
+        cache = GlyphCache()
+        image = TextRenderer(profile=PrinterProfile('tiny', width=40), cache=cache).render(u'mmmmmmmm')
+        self.assertLessEqual(image.width, 40)
+        stripes, glyph_width = cache.get(u'm').shape[:2]
+        lines = -(-8 // (40 // glyph_width))
+        self.assertEqual(image.height, stripes * 48 * lines)
+
+    def test_print_text_image(self):
+        device = MemoryTransport()
+        EpsonPrinter(transport=device).print_text_image(u'שלום')
+        self.assertEqual(device.getvalue()[:2], b'\x1bW')
+        self.assertEqual(device.getvalue()[-1:], b'\x0c')
+
+
+if __name__ == '__main__':
+    unittest.main()
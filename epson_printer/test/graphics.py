@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from ..epsonprinter import EpsonPrinter, PrintableImage, RASTER_MODE, define_graphics, define_nv_bit_images
+from ..graphics import GraphicsRegistry
+from ..transport import MemoryTransport
+
+
+def raster_image(width, height, dots=()):
+    im = Image.new('1', (width, height), 1)
+    for dot in dots:
+        im.putpixel(dot, 0)
+    return PrintableImage.from_image(im, RASTER_MODE, band_height=2)
+
+
+class TestGraphicsCommands(unittest.TestCase):
+
+    def test_define_graphics(self):
+        image = raster_image(10, 3, [(0, 0), (9, 2)])
+        self.assertEqual(image.raster_rows(), (2, 3, b'\x80\x00\x00\x00\x00\x40'))
+        self.assertEqual(define_graphics('LG', image, nv=True),
+                         b'\x1d(L\x11\x00' + b'0C0LG\x01\x10\x00\x03\x001' + b'\x80\x00\x00\x00\x00\x40')
+
+    def test_define_large_graphics(self):
+        image = raster_image(512, 1200)
+        command = define_graphics('LG', image)
+        self.assertEqual(command[:7], b'\x1d8L\x0b\x2c\x01\x00')
+        self.assertEqual(len(command), 7 + 11 + 64 * 1200)
+
+    def test_define_nv_bit_images(self):
+        image = raster_image(8, 3, [(0, 0), (1, 2)])
+        self.assertEqual(define_nv_bit_images(image),
+                         b'\x1cq\x01' + b'\x01\x00\x01\x00' + b'\x80\x20' + b'\x00' * 6)
+
+    def test_graphics_key(self):
+        self.assertRaises(ValueError, define_graphics, 'LOGO', raster_image(8, 1))
+        self.assertRaises(ValueError, define_graphics, 'LG', PrintableImage(b'\x00', 48))
+
+
+class TestGraphicsRegistry(unittest.TestCase):
+
+    def test_print_image(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'graphics.json')
+            device = MemoryTransport()
+            printer = EpsonPrinter(transport=device)
+            logo = raster_image(16, 4, [(3, 3)])
+            GraphicsRegistry(path).print_image(printer, 'till-1', 'LG', logo, nv=True)
+            registry = GraphicsRegistry(path)
+            registry.print_image(printer, 'till-1', 'LG', logo, nv=True)
+            self.assertEqual(len(device.transfers), 3)
+            self.assertEqual(device.transfers[1], b'\x1d(L\x06\x000ELG\x01\x01')
+            self.assertEqual(device.transfers[2], device.transfers[1])
+            # a new logo is uploaded again
+            registry.print_image(printer, 'till-1', 'LG', raster_image(16, 4), nv=True)
+            self.assertEqual(device.transfers[3][:6], b'\x1d(L\x13\x000')
+        finally:
+            shutil.rmtree(directory)
+
+    def test_discarded_job(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        registry = GraphicsRegistry()
+        logo = raster_image(16, 4, [(3, 3)])
+        try:
+            with printer.job():
+                registry.print_image(printer, 'till-1', 'LG', logo, nv=True)
+                self.assertIsNone(registry.get('till-1', 'LG'))
+                raise IOError("Paper out")
+        except IOError:
+            pass
+        self.assertIsNone(registry.get('till-1', 'LG'))
+        with printer.job():
+            registry.print_image(printer, 'till-1', 'LG', logo, nv=True)
+        self.assertEqual(device.transfers[0][:6], b'\x1d(L\x13\x000')
+        self.assertIsNotNone(registry.get('till-1', 'LG'))
+
+
+if __name__ == '__main__':
+    unittest.main()
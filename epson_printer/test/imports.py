@@ -0,0 +1,15 @@
+import unittest
+from ..benchmark import baseline_import_time, import_time
+
+
+class TestImports(unittest.TestCase):
+
+    def test_import_time(self):
+        # The first run compiles the modules
+        seconds, loaded = import_time()
+        self.assertEqual(loaded, [])
+        # Compared with the import of numpy alone rather than with a fixed time, so that a slow or busy
+        # machine does not fail the test. The best of a few runs leaves out the slow ones
+        seconds = min(import_time()[0] for _ in range(3))
+        baseline = min(baseline_import_time('numpy') for _ in range(3))
+        self.assertLess(seconds, baseline)
@@ -0,0 +1,76 @@
+import errno
+import socket
+import unittest
+from PIL import Image
+from ..epsonprinter import EpsonPrinter, PrintableImage
+from ..instrumentation import Histogram, ENCODE_TIMES, ENCODE_LISTENERS, is_timeout
+from ..transport import MemoryTransport, Transport
+
+
+class FailingTransport(Transport):
+
+    def __init__(self, error):
+        self.error = error
+
+    def writev(self, buffers):
+        raise self.error
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_observe(self):
+        histogram = Histogram((0.1, 1, float('inf')))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 4)
+        self.assertAlmostEqual(snapshot['sum'], 3.65)
+        self.assertEqual(snapshot['buckets'], [(0.1, 2), (1, 1), (float('inf'), 1)])
+
+
+class TestPrinterStats(unittest.TestCase):
+
+    def test_writes_and_jobs(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        events = []
+        printer.stats.add_listener(lambda event, data: events.append((event, data['bytes'])))
+        printer.print_text("Hello")
+        with printer.job():
+            printer.bold_on()
+            printer.linefeed(2)
+        stats = printer.get_stats()
+        self.assertEqual((stats['writes'], stats['bytes'], stats['jobs'], stats['transfers']), (2, 11, 1, 2))
+        self.assertEqual(stats['write_seconds']['count'], 2)
+        self.assertEqual(stats['job_seconds']['count'], 1)
+        self.assertEqual(events, [('write', 5), ('write', 6), ('job', 6)])
+
+    def test_errors(self):
+        printer = EpsonPrinter(transport=FailingTransport(socket.timeout("timed out")))
+        events = []
+        printer.stats.add_listener(lambda event, data: events.append((event, data['timeout'])))
+        with self.assertLogs('epson_printer', 'WARNING'):
+            self.assertRaises(socket.timeout, printer.cut)
+        printer.transport = FailingTransport(IOError(errno.EPIPE, "Broken pipe"))
+        with self.assertLogs('epson_printer', 'WARNING'):
+            self.assertRaises(IOError, printer.cut)
+        stats = printer.get_stats()
+        self.assertEqual((stats['writes'], stats['errors'], stats['timeouts']), (0, 2, 1))
+        self.assertEqual(events, [('error', True), ('error', False)])
+
+    def test_is_timeout(self):
+        self.assertTrue(is_timeout(IOError(errno.ETIMEDOUT, "Operation timed out")))
+        self.assertTrue(is_timeout(type('USBTimeoutError', (IOError,), {})()))
+        self.assertFalse(is_timeout(ValueError()))
+
+    def test_encode_times(self):
+        events = []
+        listener = lambda event, data: events.append((event, data['width'], data['height']))
+        ENCODE_LISTENERS.append(listener)
+        try:
+            count = ENCODE_TIMES.snapshot()['count']
+            PrintableImage.from_image(Image.new('1', (10, 30), 1))
+            self.assertEqual(ENCODE_TIMES.snapshot()['count'], count + 1)
+            self.assertEqual(events, [('encode', 10, 30)])
+        finally:
+            ENCODE_LISTENERS.remove(listener)
@@ -0,0 +1,80 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from ..epsonprinter import EpsonPrinter, PrintableImage, RASTER_MODE, read_job_header
+from ..precompile import precompile, main
+from ..transport import MemoryTransport
+
+
+class TestJobFile(unittest.TestCase):
+
+    def test_save_load(self):
+        printable = PrintableImage.from_image(Image.open('logo.png'), RASTER_MODE)
+        f = io.BytesIO()
+        printable.save(f, b'\x01' * 32, b'\x02' * 32)
+        self.assertEqual(len(f.getvalue()), 80 + printable.size)
+        f.seek(0)
+        header = read_job_header(f)
+        self.assertEqual(header, (2, RASTER_MODE, 200, 209, printable.size, b'\x01' * 32, b'\x02' * 32))
+        f.seek(0)
+        loaded = PrintableImage.load(f)
+        self.assertEqual((loaded.data, loaded.height, loaded.mode, loaded.width),
+                         (printable.data, printable.height, printable.mode, printable.width))
+
+    def test_bad_files(self):
+        self.assertRaises(ValueError, PrintableImage.load, io.BytesIO(b'GIF89a'))
+        f = io.BytesIO()
+        PrintableImage(b'\x01\x02', 48).save(f)
+        self.assertRaises(ValueError, PrintableImage.load, io.BytesIO(f.getvalue()[:-1]))
+        self.assertRaises(ValueError, PrintableImage.load, io.BytesIO(b'ESCP\x01' + f.getvalue()[5:]))
+
+
+class TestPrecompile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.directory, 'images')
+        os.mkdir(self.source_dir)
+        for name in ('logo.png', 'copy.PNG'):
+            shutil.copy('logo.png', os.path.join(self.source_dir, name))
+        with open(os.path.join(self.source_dir, 'notes.txt'), 'w') as f:
+            f.write("not an image")
+        self.output_dir = os.path.join(self.directory, 'jobs')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_precompile(self):
+        results = precompile(self.source_dir, self.output_dir, compact=True, jobs=2)
+        self.assertEqual(sorted(os.path.basename(source) for source in results), ['copy.PNG', 'logo.png'])
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['copy.escpos', 'logo.escpos'])
+
+        device = MemoryTransport()
+        EpsonPrinter(transport=device).print_job_file(os.path.join(self.output_dir, 'logo.escpos'))
+        expected = MemoryTransport()
+        EpsonPrinter(transport=expected).print_image(PrintableImage.from_image(Image.open('logo.png'), compact=True))
+        self.assertEqual(device.getvalue(), expected.getvalue())
+
+        # Unchanged sources are not encoded again, unless the encoding parameters changed
+        self.assertEqual(set(precompile(self.source_dir, self.output_dir, compact=True, jobs=2).values()),
+                         set([None]))
+        for params in (dict(), dict(mode=RASTER_MODE), dict(compact=True, profile='58mm'),
+                       dict(compact=True, rotate=True), dict(compact=True, dither='atkinson')):
+            results = precompile(self.source_dir, self.output_dir, jobs=1, **params)
+            self.assertNotIn(None, results.values())
+            with open(os.path.join(self.output_dir, 'logo.escpos'), 'rb') as f:
+                self.assertEqual(read_job_header(f).mode, params.get('mode', 'column'))
+
+    def test_same_name(self):
+        shutil.copy('logo.png', os.path.join(self.source_dir, 'logo.gif'))
+        self.assertRaises(ValueError, precompile, self.source_dir, self.output_dir, jobs=1)
+        self.assertFalse(os.path.exists(self.output_dir))
+
+    def test_main(self):
+        self.assertEqual(main(['--mode', 'raster', '--jobs', '1', self.source_dir, self.output_dir]), 0)
+        with open(os.path.join(self.output_dir, 'logo.escpos'), 'rb') as f:
+            self.assertEqual(read_job_header(f).mode, RASTER_MODE)
+        self.assertEqual(main([self.source_dir]), 2)
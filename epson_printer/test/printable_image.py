@@ -1,17 +1,40 @@
 import unittest
-from ..epsonprinter import PrintableImage
+from ..epsonprinter import PrintableImage, RASTER_MODE
 from PIL import Image
-from time import time
+
+
+def render_columns(data):
+    """ Black dots (x, y) printed by a column mode payload, y in motion units """
+    data = bytearray(data)
+    dots = set()
+    (x, y, i) = (0, 0, 0)
+    while i < len(data):
+        command = data[i + 1]
+        if command == 42:  # ESC * 33
+            n = data[i + 3] + 256 * data[i + 4]
+            columns = data[i + 5:i + 5 + 3 * n]
+            for column in range(n):
+                for bit in range(24):
+                    if columns[3 * column + bit // 8] & (128 >> bit % 8):
+                        dots.add((x + column, y + 2 * bit))
+            x += n
+            i += 5 + 3 * n
+        elif command == 36:  # ESC $
+            x = data[i + 2] + 256 * data[i + 3]
+            i += 4
+        elif command == 74:  # ESC J
+            (x, y) = (0, y + data[i + 2])
+            i += 3
+        else:
+            raise ValueError("Unexpected command %d" % command)
+    return dots, y
 
 
 class TestPrintableImage(unittest.TestCase):
 
     def test_from_image(self):
         im = Image.open('logo.png')
-        start = time()
         printable = PrintableImage.from_image(im)
-        elapsed = time() - start
-        print elapsed
         height = printable.height
         data = printable.data
         self.assertEqual(height, 432)
@@ -236,8 +259,69 @@ class TestPrintableImage(unittest.TestCase):
                     0, 0, 0, 1, 0, 0, 0, 128, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 128, 0, 1, 0, 0, 0, 0, 0, \
                     1, 0, 0, 0, 128, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 128, 85, 84, 0, 34, 34, 0, 27, 74, 48]
         self.assertEqual(len(data), len(expected))
-        self.assertEqual(data, expected)
+        self.assertEqual(data, bytearray(expected))
+
+    def test_from_image_wide(self):
+        im = Image.new('1', (1024, 100), 0)
+        printable = PrintableImage.from_image(im)
+        # resized to 512x50, padded to 3 stripes of 24 dots
+        self.assertEqual(printable.height, 144)
+        stripe_size = 5 + 3 * 512 + 3
+        self.assertEqual(len(printable.data), 3 * stripe_size)
+        self.assertEqual(printable.data[:5], bytearray([27, 42, 33, 0, 2]))
+        self.assertEqual(printable.data[stripe_size - 3:stripe_size], bytearray([27, 74, 48]))
+
+    def test_from_image_raster(self):
+        im = Image.new('1', (10, 5), 1)
+        im.putpixel((0, 0), 0)
+        im.putpixel((9, 4), 0)
+        printable = PrintableImage.from_image(im, RASTER_MODE, band_height=3)
+        self.assertEqual(printable.height, 5)
+        self.assertEqual(printable.data,
+                         b'\x1dv0\x00\x02\x00\x03\x00' + b'\x80\x00' + b'\x00\x00' * 2 +
+                         b'\x1dv0\x00\x02\x00\x02\x00' + b'\x00\x00' + b'\x00\x40')
+
+    def test_from_image_compact(self):
+        im = Image.open('logo.png')
+        printable = PrintableImage.from_image(im)
+        compact = PrintableImage.from_image(im, compact=True)
+        self.assertEqual(compact.height, printable.height)
+        self.assertEqual(render_columns(compact.data), render_columns(printable.data))
+        self.assertLess(compact.size, printable.size * 0.85)
+
+    def test_from_image_compact_blank_stripes(self):
+        im = Image.new('1', (100, 24 * 8), 1)
+        im.putpixel((10, 0), 0)
+        im.putpixel((12, 24 * 7 + 1), 0)
+        printable = PrintableImage.from_image(im, compact=True)
+        self.assertEqual(printable.data,
+                         b'\x1b$\x0a\x00' + b'\x1b*!\x01\x00' + b'\x80\x00\x00' +
+                         b'\x1bJ\xff' + b'\x1bJ\x51' +
+                         b'\x1b$\x0c\x00' + b'\x1b*!\x01\x00' + b'\x40\x00\x00' + b'\x1bJ\x30')
+        self.assertEqual(render_columns(printable.data), render_columns(PrintableImage.from_image(im).data))
+
+    def test_from_image_raster_compact(self):
+        im = Image.new('1', (40, 2), 1)
+        im.putpixel((9, 1), 0)
+        printable = PrintableImage.from_image(im, RASTER_MODE, compact=True)
+        self.assertEqual(printable.data, b'\x1dv0\x00\x02\x00\x02\x00' + b'\x00\x00' + b'\x00\x40')
+
+    def test_append_modes(self):
+        column = PrintableImage(b'\x01', 48)
+        raster = PrintableImage(b'\x02', 5, RASTER_MODE)
+        self.assertRaises(ValueError, column.append, raster)
+        self.assertEqual(PrintableImage([], 0).append(raster).mode, RASTER_MODE)
 
+    def test_append(self):
+        first = PrintableImage(b'\x01\x02', 48)
+        second = PrintableImage(b'\x03', 96)
+        chunk = second.chunks[0]
+        first.append(second)
+        self.assertEqual(first.height, 144)
+        self.assertEqual(first.data, b'\x01\x02\x03')
+        self.assertEqual(first.size, 3)
+        # chunks are linked, not copied
+        self.assertIs(first.chunks[1], chunk)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,241 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from PIL import Image
+from ..epsonprinter import EpsonPrinter, PrintableImage, b64decode, open_image, COLUMN_MODE, RASTER_MODE
+from ..transport import MemoryTransport, Transport
+
+
+class TestEpsonPrinter(unittest.TestCase):
+
+    def test_write(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        printer.print_text(u'caf\xe9 cr\xe8me')
+        printer.linefeed(2)
+        self.assertEqual(device.transfers, [b'caf\x82 cr\x8ame', b'\x1bd\x02'])
+
+    def test_print_image(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        printer.print_images(PrintableImage(b'\x01', 48), PrintableImage(b'\x02', 480))
+        self.assertEqual(device.getvalue(), b'\x1bW.\x00\x00\x00\x00\x02\x10\x02\x1bL\x01\x02\x0c')
+
+    def test_print_image_raster(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        printer.print_image(PrintableImage(b'\x1dv0\x00\x01\x00\x01\x00\x80', 1, RASTER_MODE))
+        # no page mode around raster images
+        self.assertEqual(device.getvalue(), b'\x1dv0\x00\x01\x00\x01\x00\x80')
+
+    def test_print_image_stream(self):
+        image = Image.open('logo.png')
+        for mode, band_height in ((COLUMN_MODE, 48), (RASTER_MODE, 24)):
+            device = MemoryTransport()
+            printer = EpsonPrinter(transport=device)
+            printer.print_image_stream(image, mode, band_height)
+            expected = MemoryTransport()
+            EpsonPrinter(transport=expected).print_image(PrintableImage.from_image(image, mode, band_height))
+            self.assertEqual(device.getvalue(), expected.getvalue())
+            # one write per band, plus page mode commands
+            self.assertEqual(len(device.transfers), 9 if mode == RASTER_MODE else 7)
+
+    def test_print_image_stream_compact(self):
+        image = Image.open('logo.png')
+        device = MemoryTransport()
+        EpsonPrinter(transport=device).print_image_stream(image, band_height=48, compact=True)
+        expected = MemoryTransport()
+        EpsonPrinter(transport=expected).print_image(PrintableImage.from_image(image, compact=True))
+        self.assertEqual(device.getvalue(), expected.getvalue())
+
+    def test_print_image_stream_invalid(self):
+        image = Image.open('logo.png')
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        self.assertRaises(ValueError, printer.print_image_stream, image, band_height=30)
+        self.assertRaises(ValueError, PrintableImage.iter_stripes, image, band_height=30)
+        # nothing, not even the page mode commands, is written
+        self.assertEqual(device.transfers, [])
+
+
+class TestPrintJob(unittest.TestCase):
+
+    def test_job(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        with printer.job() as job:
+            job.bold_on()
+            printer.print_text("Total")
+            with printer.job():
+                job.bold_off()
+            self.assertEqual(device.transfers, [])
+        self.assertEqual(device.transfers, [b'\x1bE\x01Total\x1bE\x00'])
+        printer.cut()
+        self.assertEqual(len(device.transfers), 2)
+
+    def test_job_flush(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        with printer.job() as job:
+            job.linefeed()
+            job.flush()
+            self.assertEqual(device.transfers, [b'\x1bd\x01'])
+            job.cut()
+        self.assertEqual(device.transfers, [b'\x1bd\x01', b'\x1dV\x00'])
+
+    def test_job_error(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        with self.assertRaises(ValueError):
+            with printer.job() as job:
+                job.print_text("Half a receipt")
+                raise ValueError()
+        self.assertEqual(device.transfers, [])
+
+
+def encoded_image(size, format):
+    image = Image.new('RGB', size, 'white')
+    image.paste((0, 0, 0), (0, 0, size[0] // 2, size[1]))
+    data = io.BytesIO()
+    image.save(data, format)
+    return data.getvalue()
+
+
+class TestLoading(unittest.TestCase):
+
+    def test_open_image_draft(self):
+        image = open_image(io.BytesIO(encoded_image((2400, 600), 'JPEG')))
+        self.assertEqual(image.size, (600, 150))
+        self.assertEqual(image.mode, 'L')
+
+    def test_open_image_reduce(self):
+        image = open_image(io.BytesIO(encoded_image((1600, 400), 'PNG')))
+        self.assertEqual(image.size, (534, 134))
+        image = open_image(io.BytesIO(encoded_image((1000, 400), 'PNG')))
+        self.assertEqual(image.size, (1000, 400))
+
+    def test_b64decode(self):
+        data = os.urandom(1000)
+        for text in (base64.b64encode(data), base64.encodebytes(data), base64.b64encode(data).decode('ascii')):
+            self.assertEqual(b64decode(text, chunk_size=7), data)
+            self.assertEqual(b64decode(io.BytesIO(base64.encodebytes(data)), chunk_size=7), data)
+        # Other characters are ignored, as by base64.b64decode
+        text = b'!' + base64.b64encode(data)[:5] + b'!\t-' + base64.b64encode(data)[5:]
+        self.assertEqual(b64decode(text, chunk_size=7), base64.b64decode(text))
+
+    def test_print_image_from_buffer(self):
+        data = encoded_image((2048, 96), 'PNG')
+        device = MemoryTransport()
+        EpsonPrinter(transport=device).print_image_from_buffer(base64.encodebytes(data), mode=RASTER_MODE)
+        # 512 dots wide, left half black
+        self.assertEqual(device.getvalue()[:8], b'\x1dv0\x00\x40\x00\x18\x00')
+        self.assertEqual(device.getvalue()[8:8 + 64], b'\xff' * 32 + b'\x00' * 32)
+
+
+class CountingTransport(Transport):
+    """ Counts the bytes without keeping them """
+
+    def __init__(self):
+        self.size = 0
+
+    def writev(self, buffers):
+        self.size += sum(len(buf) for buf in buffers)
+        self.transfer_count += 1
+
+
+class FailingTransport(Transport):
+
+    def writev(self, buffers):
+        raise IOError("Broken pipe")
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'job.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_capture_replay(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        with printer.capture(self.path):
+            printer.print_text("Hello")
+            with printer.job():
+                printer.print_image(PrintableImage(b'\x01', 48))
+                printer.cut()
+        self.assertEqual(device.transfers, [])
+        with open(self.path, 'rb') as f:
+            recorded = f.read()
+
+        printer.replay(self.path, chunk_size=4)
+        self.assertEqual(device.getvalue(), recorded)
+        self.assertEqual(device.transfers[0], b'Hell')
+        self.assertEqual(printer.get_stats()['bytes'], 2 * len(recorded))
+
+    def test_capture_send(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        with printer.job():
+            printer.print_text("before")
+            with printer.capture(self.path, send=True):
+                printer.print_text("during")
+        printer.print_text("after")
+        self.assertEqual(device.transfers, [b'before', b'during', b'after'])
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'during')
+
+    def test_capture_error(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        with printer.job():
+            printer.print_text("before")
+            try:
+                with printer.capture(self.path):
+                    printer.print_text("captured")
+                    raise IOError("Disk full")
+            except IOError:
+                pass
+            printer.print_text("after")
+        self.assertEqual(device.transfers, [b'before', b'after'])
+
+    def test_replay_error(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 100)
+        printer = EpsonPrinter(transport=FailingTransport())
+        with self.assertRaises(IOError) as context:
+            printer.replay(self.path, chunk_size=10)
+        self.assertEqual(str(context.exception), "Broken pipe")
+        # The mapping was closed
+        os.unlink(self.path)
+
+    def test_replay_empty(self):
+        open(self.path, 'wb').close()
+        device = MemoryTransport()
+        EpsonPrinter(transport=device).replay(self.path)
+        self.assertEqual(device.transfers, [])
+
+    def test_replay_memory(self):
+        with open(self.path, 'wb') as f:
+            f.write(os.urandom(1024) * 8192)
+        device = CountingTransport()
+        printer = EpsonPrinter(transport=device)
+        tracemalloc.start()
+        try:
+            printer.replay(self.path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(device.size, 8 * 1024 * 1024)
+        self.assertEqual(device.transfer_count, 8)
+        self.assertLess(peak, 64 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
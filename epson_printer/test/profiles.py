@@ -0,0 +1,64 @@
+import unittest
+from PIL import Image
+from ..epsonprinter import EpsonPrinter, PrintableImage, COLUMN_MODE, RASTER_MODE
+from ..profiles import PrinterProfile, get_profile, SINGLE_DENSITY, PAGE_MODE, STATUS
+from ..transport import MemoryTransport
+
+
+def half_black(w, h):
+    image = Image.new('1', (w, h), 1)
+    image.paste(0, (0, 0, w // 2, h))
+    return image
+
+
+class TestProfiles(unittest.TestCase):
+
+    def test_default(self):
+        profile = get_profile(None)
+        self.assertEqual((profile.width, profile.column_width), (512, 512))
+        self.assertEqual(get_profile('80mm').width, 512)
+        self.assertRaises(ValueError, get_profile, 'TM-X')
+
+    def test_narrow_printer(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device, profile='58mm')
+        image = PrintableImage.from_image(half_black(768, 48), profile='58mm')
+        self.assertEqual((image.width, image.height), (384, 48))
+        self.assertEqual(image.chunks[0][:5], b'\x1b*!\x80\x01')
+        printer.print_image(image)
+        # Print area 384 dots wide from the left edge
+        self.assertEqual(device.getvalue()[:8], b'\x1bW\x00\x00\x00\x00\x80\x01')
+
+        raster = PrintableImage.from_image(half_black(768, 48), RASTER_MODE, profile='58mm')
+        self.assertEqual(raster.chunks[0], b'\x1dv0\x00\x30\x00\x18\x00')
+
+        # Images encoded for wider printers would be clipped
+        self.assertRaises(ValueError, printer.print_image, PrintableImage.from_image(half_black(768, 48)))
+
+    def test_single_density(self):
+        profile = PrinterProfile('impact', width=400, density=SINGLE_DENSITY)
+        image = PrintableImage.from_image(half_black(400, 24), profile=profile)
+        self.assertEqual(image.width, 200)
+        self.assertEqual(image.chunks[0][:5], b'\x1b* \xc8\x00')
+        compact = PrintableImage.from_image(half_black(400, 24).rotate(180), profile=profile, compact=True)
+        # The margin is skipped in motion units, two per column
+        self.assertEqual(compact.data[:4], b'\x1b$\xc8\x00')
+
+    def test_commands(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device, profile=PrinterProfile('basic', commands=[STATUS]))
+        self.assertRaises(ValueError, printer.barcode, '123')
+        self.assertRaises(ValueError, printer.qr_code, 'abc')
+        self.assertRaises(ValueError, PrintableImage.from_image, half_black(64, 24), RASTER_MODE,
+                          profile=printer.profile)
+        self.assertEqual(device.transfers, [])
+
+        # Column images are printed in standard mode without page mode
+        image = PrintableImage.from_image(half_black(64, 24), COLUMN_MODE)
+        printer.print_image(image)
+        self.assertEqual(device.transfers, [image.data])
+        self.assertFalse(printer.profile.supports(PAGE_MODE))
+
+
+if __name__ == '__main__':
+    unittest.main()
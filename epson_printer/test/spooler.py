@@ -0,0 +1,98 @@
+import threading
+import unittest
+from PIL import Image
+from ..epsonprinter import EpsonPrinter
+from ..spooler import Spooler
+from ..status import PrinterStatus, PrinterOfflineError
+from ..transport import MemoryTransport, ScriptedTransport, StatusAwareTransport, FAIL_FAST
+
+
+class FlakyTransport(MemoryTransport):
+    """ Fails the first `failures` writes """
+
+    def __init__(self, failures):
+        MemoryTransport.__init__(self)
+        self.failures = failures
+
+    def writev(self, buffers):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("Pipe error")
+        MemoryTransport.writev(self, buffers)
+
+
+class TestSpooler(unittest.TestCase):
+
+    def test_priority(self):
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking(p):
+            started.set()
+            release.wait()
+
+        with Spooler([printer]) as spooler:
+            spooler.submit(blocking)
+            started.wait()
+            spooler.submit(lambda p: p.print_text("low"))
+            spooler.submit(lambda p: p.print_text("high"), priority=10)
+            release.set()
+        self.assertEqual(device.transfers, [b'high', b'low'])
+
+    def test_least_loaded(self):
+        devices = [MemoryTransport(), MemoryTransport()]
+        printers = [EpsonPrinter(transport=device) for device in devices]
+        release = threading.Event()
+        with Spooler(printers) as spooler:
+            spooler.submit(lambda p: release.wait(), printer=printers[0])
+            for _ in range(3):
+                spooler.submit(lambda p: p.print_text("x")).result(timeout=5)
+            release.set()
+        self.assertEqual(devices[0].transfers, [])
+        self.assertEqual(devices[1].transfers, [b'x'] * 3)
+
+    def test_retry(self):
+        device = FlakyTransport(2)
+        with Spooler([EpsonPrinter(transport=device)], retry_delay=0) as spooler:
+            future = spooler.submit(lambda p: p.print_text("Hello"))
+            self.assertIsNone(future.result(timeout=5))
+        self.assertEqual(device.transfers, [b'Hello'])
+
+    def test_retries_exhausted(self):
+        device = FlakyTransport(5)
+        with Spooler([EpsonPrinter(transport=device)], retries=2, retry_delay=0) as spooler:
+            future = spooler.submit(lambda p: p.print_text("Hello"))
+            self.assertIsInstance(future.exception(timeout=5), IOError)
+        self.assertEqual(device.failures, 2)
+
+    def test_reroute_offline(self):
+        offline = ScriptedTransport()
+        offline.set_status(PrinterStatus(paper_out=True))
+        online = ScriptedTransport()
+        online.set_status(PrinterStatus())
+        printers = [EpsonPrinter(transport=StatusAwareTransport(device, FAIL_FAST)) for device in (offline, online)]
+        with Spooler(printers, retry_delay=0) as spooler:
+            # Pinned jobs are not moved
+            pinned = spooler.submit(lambda p: p.print_text("pinned"), printer=printers[0])
+            self.assertIsInstance(pinned.exception(timeout=5), PrinterOfflineError)
+            spooler.workers[0].offline_until = 0
+            spooler.workers[1].load = 1
+            # Routed to the offline printer, the least loaded, then moved
+            spooler.submit(lambda p: p.print_text("moved")).result(timeout=5)
+            spooler.workers[1].load = 0
+            spooler.submit(lambda p: p.print_text("routed")).result(timeout=5)
+        self.assertNotIn(b'moved', offline.transfers)
+        self.assertEqual([t for t in online.transfers if not t.startswith(b'\x10\x04')], [b'moved', b'routed'])
+
+    def test_submit_image(self):
+        device = MemoryTransport()
+        with Spooler([EpsonPrinter(transport=device)]) as spooler:
+            spooler.submit_image(Image.open('logo.png')).result(timeout=5)
+        self.assertEqual(len(device.transfers), 1)
+        self.assertEqual(device.transfers[0][:3], b'\x1bW.')
+
+
+if __name__ == '__main__':
+    unittest.main()
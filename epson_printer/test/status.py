@@ -0,0 +1,104 @@
+import socket
+import unittest
+from ..epsonprinter import EpsonPrinter
+from ..status import PrinterStatus, PrinterOfflineError, PrinterBusyError
+from ..transport import MemoryTransport, ScriptedTransport, StatusAwareTransport, FAIL_FAST, PAUSE
+
+
+class StalledTransport(ScriptedTransport):
+    """ Times out on every write which is not a status query """
+
+    def writev(self, buffers):
+        if not b''.join(buffers).startswith(b'\x10\x04'):
+            raise socket.timeout("timed out")
+        ScriptedTransport.writev(self, buffers)
+
+
+class TestPrinterStatus(unittest.TestCase):
+
+    def test_from_dle_eot(self):
+        self.assertEqual(PrinterStatus.from_dle_eot(0x16, 0x12, 0x12), PrinterStatus())
+        status = PrinterStatus.from_dle_eot(0x1e, 0x36, 0x7e)
+        self.assertEqual(status, PrinterStatus(online=False, cover_open=True, paper_out=True, paper_near_end=True))
+        self.assertFalse(status.ready)
+        self.assertRaises(ValueError, PrinterStatus.from_dle_eot, 0x00, 0x12, 0x12)
+
+    def test_from_asb(self):
+        self.assertEqual(PrinterStatus.from_asb(b'\x10\x00\x00\x00'), PrinterStatus())
+        self.assertEqual(PrinterStatus.from_asb(b'\x38\x00\x0f\x00'),
+                         PrinterStatus(online=False, cover_open=True, paper_out=True, paper_near_end=True))
+        self.assertRaises(ValueError, PrinterStatus.from_asb, b'\x10\x00')
+
+    def test_query_status(self):
+        device = ScriptedTransport()
+        for status in (PrinterStatus(), PrinterStatus(online=False, cover_open=True), PrinterStatus(paper_out=True),
+                       PrinterStatus(paper_near_end=True, error=True, feeding=True)):
+            device.set_status(status)
+            self.assertEqual(EpsonPrinter(transport=device).query_status(), status)
+        self.assertRaises(PrinterOfflineError, EpsonPrinter(transport=ScriptedTransport()).query_status)
+        self.assertRaises(NotImplementedError, EpsonPrinter(transport=MemoryTransport()).query_status)
+
+    def test_asb(self):
+        device = ScriptedTransport({b'\x1da\x0e': b'\x10\x00\x0c\x00'})
+        printer = EpsonPrinter(transport=device)
+        printer.enable_asb()
+        self.assertEqual(printer.read_asb(), PrinterStatus(paper_out=True))
+        self.assertIsNone(printer.read_asb())
+
+
+class TestStatusAwareTransport(unittest.TestCase):
+
+    def test_fail_fast(self):
+        device = ScriptedTransport()
+        device.set_status(PrinterStatus(cover_open=True))
+        printer = EpsonPrinter(transport=StatusAwareTransport(device, FAIL_FAST))
+        with self.assertRaises(PrinterOfflineError) as context:
+            printer.print_text("Hello")
+        self.assertTrue(context.exception.status.cover_open)
+        self.assertNotIn(b'Hello', device.transfers)
+
+    def test_pause(self):
+        paper_out = bytearray([0x12 | 0x20])
+        device = ScriptedTransport({
+            b'\x10\x04\x01': b'\x12',
+            b'\x10\x04\x02': [paper_out, paper_out, b'\x12'],
+            b'\x10\x04\x04': b'\x12'})
+        printer = EpsonPrinter(transport=StatusAwareTransport(device, PAUSE, poll_interval=0))
+        printer.print_text("Hello")
+        self.assertEqual(device.transfers.count(b'\x10\x04\x02'), 3)
+        self.assertEqual(device.transfers[-1], b'Hello')
+
+    def test_pause_max_wait(self):
+        device = ScriptedTransport()
+        device.set_status(PrinterStatus(paper_out=True))
+        printer = EpsonPrinter(transport=StatusAwareTransport(device, PAUSE, poll_interval=0, max_wait=0))
+        self.assertRaises(PrinterOfflineError, printer.print_text, "Hello")
+
+    def test_status_ttl(self):
+        device = ScriptedTransport()
+        device.set_status(PrinterStatus())
+        transport = StatusAwareTransport(device, FAIL_FAST)
+        printer = EpsonPrinter(transport=transport)
+        printer.print_text("Hello")
+        printer.print_text("World")
+        # the ready status of the first write is reused by the second one
+        self.assertEqual(device.transfers.count(b'\x10\x04\x01'), 1)
+        transport._ready_until = 0
+        device.set_status(PrinterStatus(paper_out=True))
+        self.assertRaises(PrinterOfflineError, printer.print_text, "Again")
+        self.assertNotIn(b'Again', device.transfers)
+        # queried before every write without a ttl
+        device = ScriptedTransport()
+        device.set_status(PrinterStatus())
+        printer = EpsonPrinter(transport=StatusAwareTransport(device, status_ttl=0))
+        printer.print_text("Hello")
+        printer.print_text("World")
+        self.assertEqual(device.transfers.count(b'\x10\x04\x01'), 2)
+
+    def test_buffer_full(self):
+        device = StalledTransport()
+        device.set_status(PrinterStatus())
+        printer = EpsonPrinter(transport=StatusAwareTransport(device))
+        self.assertRaises(PrinterBusyError, printer.print_text, "Hello")
+        device.set_status(PrinterStatus(online=False))
+        self.assertRaises(PrinterOfflineError, StatusAwareTransport(device, max_wait=0).writev, [b'Hello'])
@@ -0,0 +1,88 @@
+import pickle
+import unittest
+from ..epsonprinter import EpsonPrinter, PrintableImage
+from ..template import Template, compile_template
+from ..transport import MemoryTransport
+
+
+def layout(receipt):
+    receipt.print_image(PrintableImage(b'\x01', 48))
+    receipt.center()
+    receipt.field('store')
+    receipt.linefeed()
+    receipt.left_justified()
+    receipt.field('items')
+    receipt.bold_on()
+    receipt.field('total')
+    receipt.bold_off()
+    receipt.cut()
+
+
+def direct(printer, store, items, total):
+    printer.print_image(PrintableImage(b'\x01', 48))
+    printer.center()
+    printer.print_text(store)
+    printer.linefeed()
+    printer.left_justified()
+    for item in items:
+        printer.print_text(item)
+    printer.bold_on()
+    printer.print_text(total)
+    printer.bold_off()
+    printer.cut()
+
+
+class TestTemplate(unittest.TestCase):
+
+    def test_render(self):
+        template = compile_template(layout)
+        self.assertEqual(template.fields, ('store', 'items', 'total'))
+        self.assertEqual(len(template.segments), 4)
+        values = dict(store=u'Caf\xe9', items=[u'Coffee 2.50\n', b'\x1b-\x01Tea\x1b-\x00 2.00\n'], total=4.5)
+
+        device = MemoryTransport()
+        EpsonPrinter(transport=device).print_template(template, **values)
+        expected = MemoryTransport()
+        direct(EpsonPrinter(transport=expected), u'Caf\xe9', values['items'], '4.5')
+        self.assertEqual(device.transfers, [expected.getvalue()])
+
+    def test_missing_value(self):
+        template = compile_template(layout)
+        self.assertRaises(ValueError, template.render, store='Main street', items=[])
+
+    def test_immutable(self):
+        template = compile_template(layout)
+        self.assertRaises(AttributeError, setattr, template, 'fields', ())
+        copy = pickle.loads(pickle.dumps(template))
+        self.assertEqual((copy.segments, copy.fields), (template.segments, template.fields))
+
+    def test_segments(self):
+        self.assertRaises(ValueError, Template, [b'a', b'b'], [])
+        self.assertEqual(Template([b'<', b'>'], ['x']).render(x='y'), [b'<', b'y', b'>'])
+
+    def test_code_pages(self):
+        def switching(receipt):
+            receipt.print_text(u'Борщ ')
+            receipt.field('item')
+            receipt.linefeed()
+            receipt.field('city')
+
+        template = compile_template(switching)
+        self.assertEqual(template.code_pages, ('cp866', 'cp866'))
+        device = MemoryTransport()
+        printer = EpsonPrinter(transport=device)
+        printer.print_template(template, item=u'caf\xe9', city=u'Ł\xf3dź')
+        self.assertEqual(device.transfers, [
+            b'\x1bt\x11\x81\xae\xe0\xe9 ' +
+            # The value switches to cp437, the following segment is written back on cp866
+            b'caf\x1bt\x00\x82\x1bt\x11' + b'\x1bd\x01' +
+            b'\x1bt\x12\x9d\xa2d\xab\x1bt\x11'])
+        self.assertEqual(printer.code_page, 'cp866')
+
+        # After text that changed the code page, the template starts again on its encoding
+        printer.print_text(u'\u20ac')
+        self.assertEqual(device.transfers[-1], b'\x1bt\x13\xd5')
+        device.transfers = []
+        printer.print_template(template, item=u'x', city=u'y')
+        self.assertEqual(device.transfers, [b'\x1bt\x00\x1bt\x11\x81\xae\xe0\xe9 x\x1bd\x01y'])
+        self.assertEqual(printer.code_page, 'cp866')
@@ -0,0 +1,98 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from ..transport import UsbTransport, TcpTransport, FileTransport, _iter_transfers
+
+
+class FakeDevice(object):
+    """ Stands for a usb.core.Device, records every transfer """
+
+    def __init__(self, max_write=None):
+        self.transfers = []
+        self.max_write = max_write
+
+    def write(self, endpoint, data, timeout=None):
+        data = bytes(data[:self.max_write] if self.max_write else data)
+        self.transfers.append(data)
+        return len(data)
+
+
+def fake_usb_transport(device, buffer_size=8, progress=None):
+    transport = UsbTransport.__new__(UsbTransport)
+    transport.device = device
+    transport.out_ep = 0x01
+    transport.buffer_size = buffer_size
+    transport.timeout = 5000
+    transport.progress = progress
+    return transport
+
+
+class TestUsbTransport(unittest.TestCase):
+
+    def test_iter_transfers(self):
+        buffers = [b'ab', b'cdefghijklmnopqrst', b'u', b'v', b'wxyz']
+        transfers = [bytes(t) for t in _iter_transfers(buffers, 8)]
+        self.assertEqual(transfers, [b'abcdefgh', b'ijklmnop', b'qrstuvwx', b'yz'])
+
+    def test_writev(self):
+        device = FakeDevice()
+        progress = []
+        transport = fake_usb_transport(device, progress=lambda sent, total: progress.append((sent, total)))
+        transport.writev([b'\x1b@', b'caf\x82 cr\x8ame'])
+        self.assertEqual(device.transfers, [b'\x1b@caf\x82 c', b'r\x8ame'])
+        self.assertEqual(progress, [(8, 12), (12, 12)])
+
+    def test_partial_writes(self):
+        device = FakeDevice(max_write=3)
+        transport = fake_usb_transport(device)
+        transport.write(b'\x1bd\x01\x1bd\x02\x1dV\x00')
+        self.assertEqual(device.transfers, [b'\x1bd\x01', b'\x1bd\x02', b'\x1dV', b'\x00'])
+
+
+class TestTcpTransport(unittest.TestCase):
+
+    def test_writev(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        received = []
+
+        def serve():
+            connection, _ = server.accept()
+            while True:
+                data = connection.recv(65536)
+                if not data:
+                    break
+                received.append(data)
+            connection.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        payload = [b'\x1b@', bytearray(b'x' * 100000), memoryview(b'\x1dV\x00')]
+        with TcpTransport(*server.getsockname()) as transport:
+            transport.writev(payload)
+        thread.join()
+        server.close()
+        self.assertEqual(b''.join(received), b''.join(payload))
+
+
+class TestFileTransport(unittest.TestCase):
+
+    def test_writev(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with FileTransport(path) as transport:
+                transport.writev([b'\x1b@', b'Hello'])
+            with FileTransport(path) as transport:
+                transport.write(b'\x1dV\x00')
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'\x1b@Hello\x1dV\x00')
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
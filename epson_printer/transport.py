@@ -0,0 +1,386 @@
+"""
+Transports carry the ESC/POS byte stream from EpsonPrinter to a device.
+
+Every transport implements writev(buffers), which sends a list of bytes-like objects in order,
+and close(). write(data) is a shortcut for a single buffer. Transports connected both ways also
+implement read(size, timeout), used to query the status of the printer.
+"""
+import logging
+import socket
+import time
+from .instrumentation import is_timeout
+from .status import PrinterOfflineError, PrinterBusyError, query_status
+
+logger = logging.getLogger(__name__)
+
+
+def _iter_transfers(buffers, size):
+    """
+    Split and coalesce a list of buffers into transfers of at most `size` bytes.
+    Large buffers are sliced without being copied, small ones are packed together.
+    """
+    pending = bytearray()
+    for buf in buffers:
+        view = memoryview(buf)
+        offset = 0
+        if pending:
+            offset = min(size - len(pending), len(view))
+            pending += view[:offset]
+            if len(pending) < size:
+                continue
+            yield pending
+            pending = bytearray()
+        while len(view) - offset >= size:
+            yield view[offset:offset + size]
+            offset += size
+        pending += view[offset:]
+    if pending:
+        yield pending
+
+
+class Transport(object):
+    """ Base class of the transports """
+
+    # Number of transfers (USB transfers, system calls) made so far
+    transfer_count = 0
+
+    def write(self, data):
+        self.writev([data])
+
+    def writev(self, buffers):
+        raise NotImplementedError()
+
+    def read(self, size, timeout=None):
+        """
+        Read at most size bytes sent by the printer, b'' if nothing was received within timeout seconds
+        """
+        raise NotImplementedError("%s cannot read from the printer" % type(self).__name__)
+
+    def query_status(self, timeout=1.0):
+        """ The PrinterStatus reported by the printer, see epson_printer.status """
+        return query_status(self, timeout)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class UsbTransport(Transport):
+    """ A printer plugged on the USB bus """
+
+    def __init__(self, id_vendor, id_product, out_ep=0x01, buffer_size=None, timeout=5000, progress=None,
+                 in_ep=0x82):
+        """
+        @param id_vendor   : Vendor ID
+        @param id_product  : Product ID
+        @param out_ep      : Output end point
+        @param buffer_size : Maximum size of a single USB transfer. Defaults to 64 packets of the output end point
+        @param timeout     : Timeout of a single transfer in milliseconds
+        @param progress    : Callable receiving (bytes_sent, bytes_total) after each transfer
+        @param in_ep       : Input end point, where the printer sends its status
+        """
+        import usb.core
+        self.out_ep = out_ep
+        self.in_ep = in_ep
+        self.timeout = timeout
+        self.progress = progress
+
+        # Search device on USB tree and set is as printer
+        self.device = usb.core.find(idVendor=id_vendor, idProduct=id_product)
+        if self.device is None:
+            raise ValueError("Printer not found. Make sure the cable is plugged in.")
+
+        if self.device.is_kernel_driver_active(0):
+            try:
+                self.device.detach_kernel_driver(0)
+            except usb.core.USBError as e:
+                logger.warning("Could not detach kernel driver: %s", e)
+
+        try:
+            self.device.set_configuration()
+            self.device.reset()
+        except usb.core.USBError as e:
+            logger.warning("Could not set configuration: %s", e)
+
+        self.buffer_size = buffer_size or 64 * self._max_packet_size()
+
+    def _max_packet_size(self):
+        """ wMaxPacketSize of the output end point, 64 bytes (full speed bulk) if it cannot be read """
+        import usb.core
+        try:
+            for interface in self.device.get_active_configuration():
+                for endpoint in interface:
+                    if endpoint.bEndpointAddress == self.out_ep:
+                        return endpoint.wMaxPacketSize
+        except usb.core.USBError:
+            pass
+        return 64
+
+    def writev(self, buffers):
+        """ Stream the buffers in transfers of at most buffer_size bytes """
+        total = sum(len(buf) for buf in buffers)
+        sent = 0
+        for transfer in _iter_transfers(buffers, self.buffer_size):
+            written = 0
+            while written < len(transfer):
+                written += self.device.write(self.out_ep, transfer[written:], timeout=self.timeout)
+                self.transfer_count += 1
+            sent += written
+            if self.progress is not None:
+                self.progress(sent, total)
+
+    def read(self, size, timeout=None):
+        import usb.core
+        try:
+            data = self.device.read(self.in_ep, size, timeout=self.timeout if timeout is None else int(timeout * 1000))
+        except usb.core.USBError as e:
+            if is_timeout(e):
+                return b''
+            raise
+        return bytes(bytearray(data))
+
+    def close(self):
+        import usb.util
+        usb.util.dispose_resources(self.device)
+
+
+class TcpTransport(Transport):
+    """ A network printer listening for raw ESC/POS on a TCP port, 9100 by default """
+
+    # Maximum number of buffers handed to a single sendmsg call
+    MAX_IOV = 1024
+
+    def __init__(self, host, port=9100, timeout=10, send_buffer_size=None):
+        """
+        @param host             : Printer host name or address
+        @param port             : Printer TCP port
+        @param timeout          : Timeout of connection and send operations in seconds
+        @param send_buffer_size : Size of the socket send buffer (SO_SNDBUF), system default if None
+        """
+        self.socket = socket.create_connection((host, port), timeout)
+        # Commands are coalesced by writev, do not let Nagle's algorithm delay them
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if send_buffer_size:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer_size)
+
+    def writev(self, buffers):
+        """ Send all the buffers with as few system calls as possible """
+        if not hasattr(self.socket, 'sendmsg'):
+            self.socket.sendall(b''.join(buffers))
+            self.transfer_count += 1
+            return
+        views = [memoryview(buf) for buf in buffers if len(buf)]
+        first = 0
+        while first < len(views):
+            sent = self.socket.sendmsg(views[first:first + self.MAX_IOV])
+            self.transfer_count += 1
+            while sent and sent >= len(views[first]):
+                sent -= len(views[first])
+                first += 1
+            if sent:
+                views[first] = views[first][sent:]
+
+    def read(self, size, timeout=None):
+        previous = self.socket.gettimeout()
+        if timeout is not None:
+            self.socket.settimeout(timeout)
+        try:
+            return self.socket.recv(size)
+        except socket.timeout:
+            return b''
+        finally:
+            self.socket.settimeout(previous)
+
+    def close(self):
+        self.socket.close()
+
+
+class FileTransport(Transport):
+    """ Appends the byte stream to a file or to a device node such as /dev/usb/lp0 """
+
+    def __init__(self, file, mode='ab'):
+        """
+        @param file : A path or a binary file object
+        @param mode : Mode used to open the path
+        """
+        if hasattr(file, 'write'):
+            self.file = file
+            self.owns_file = False
+        else:
+            self.file = open(file, mode)
+            self.owns_file = True
+
+    def writev(self, buffers):
+        self.file.writelines(buffers)
+        self.file.flush()
+        self.transfer_count += 1
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+
+class TeeTransport(Transport):
+    """ Writes to several transports, e.g. a printer and a FileTransport recording what it receives """
+
+    def __init__(self, transports):
+        """
+        @param transports : The transports, the first one is the one read from
+        """
+        self.transports = transports
+
+    @property
+    def transfer_count(self):
+        return self.transports[0].transfer_count
+
+    def writev(self, buffers):
+        for transport in self.transports:
+            transport.writev(buffers)
+
+    def read(self, size, timeout=None):
+        return self.transports[0].read(size, timeout)
+
+    def close(self):
+        for transport in self.transports:
+            transport.close()
+
+
+class MemoryTransport(Transport):
+    """ Keeps everything written in memory. Each writev call is recorded as one transfer """
+
+    def __init__(self):
+        self.transfers = []
+
+    def writev(self, buffers):
+        self.transfers.append(b''.join(buffers))
+        self.transfer_count += 1
+
+    def getvalue(self):
+        """ Everything written so far """
+        return b''.join(self.transfers)
+
+
+class ScriptedTransport(MemoryTransport):
+    """
+    A MemoryTransport answering the queries written to it with scripted replies, to test how the
+    code reacts to the status of a printer:
+
+        transport = ScriptedTransport()
+        transport.set_status(PrinterStatus(paper_out=True))
+    """
+
+    def __init__(self, replies=None):
+        """
+        @param replies : Maps each query (bytes written in a single transfer) to its reply, or to a list of
+                         replies returned in turn, the last one being repeated
+        """
+        MemoryTransport.__init__(self)
+        self.replies = dict(replies or {})
+        self.pending = bytearray()
+
+    def set_status(self, status):
+        """ Reply to DLE EOT queries with the bytes of a PrinterStatus """
+        self.replies[b'\x10\x04\x01'] = bytearray([0x1a if not status.online else 0x12])
+        self.replies[b'\x10\x04\x02'] = bytearray([
+            0x12 | 0x04 * status.cover_open | 0x08 * status.feeding | 0x20 * status.paper_out | 0x40 * status.error])
+        self.replies[b'\x10\x04\x04'] = bytearray([0x12 | 0x0c * status.paper_near_end | 0x60 * status.paper_out])
+
+    def writev(self, buffers):
+        MemoryTransport.writev(self, buffers)
+        reply = self.replies.get(self.transfers[-1])
+        if isinstance(reply, list):
+            reply = reply.pop(0) if len(reply) > 1 else reply[0]
+        if reply is not None:
+            self.pending += reply
+
+    def read(self, size, timeout=None):
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+
+# What StatusAwareTransport does when the printer is not ready
+PAUSE = 'pause'
+FAIL_FAST = 'fail-fast'
+
+
+class StatusAwareTransport(Transport):
+    """
+    Checks the status of the printer before every write. When there is no paper, the cover is open
+    or the printer is in error, it either waits for the printer to be ready (PAUSE) or raises
+    PrinterOfflineError at once (FAIL_FAST), so that the job can be sent to another printer instead
+    of blocking until the write timeout. A write timing out on a ready printer, whose receive buffer
+    is full, raises PrinterBusyError.
+
+    A ready status is trusted for status_ttl seconds, so that the writes of a job do not each cost
+    three DLE EOT round trips. It is queried again after that, and after any failed write.
+    """
+
+    def __init__(self, transport, policy=PAUSE, poll_interval=0.5, max_wait=60, status_timeout=1.0,
+                 status_ttl=2.0):
+        """
+        @param transport      : The transport to the printer, it must implement read
+        @param policy         : PAUSE or FAIL_FAST
+        @param poll_interval  : Delay between two status queries while pausing, in seconds
+        @param max_wait       : Maximum pause in seconds, PrinterOfflineError is raised after that
+        @param status_timeout : Maximum time to wait for the reply to a status query, in seconds
+        @param status_ttl     : Time during which a ready status is not queried again, in seconds
+        """
+        if policy not in (PAUSE, FAIL_FAST):
+            raise ValueError("Unknown policy: %s" % policy)
+        self.transport = transport
+        self.policy = policy
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.status_timeout = status_timeout
+        self.status_ttl = status_ttl
+        self._ready_until = 0
+
+    @property
+    def transfer_count(self):
+        return self.transport.transfer_count
+
+    def query_status(self, timeout=None):
+        return self.transport.query_status(self.status_timeout if timeout is None else timeout)
+
+    def wait_ready(self):
+        """ Return the status once the printer is ready, according to the policy """
+        deadline = time.time() + self.max_wait
+        while True:
+            try:
+                status = self.query_status()
+            except PrinterOfflineError:
+                status = None
+            if status is not None and status.ready:
+                self._ready_until = time.time() + self.status_ttl
+                return status
+            if self.policy == FAIL_FAST or time.time() >= deadline:
+                raise PrinterOfflineError("Printer not ready: %r" % status, status)
+            logger.info("Printer not ready, waiting: %r", status)
+            time.sleep(self.poll_interval)
+
+    def writev(self, buffers):
+        if time.time() >= self._ready_until:
+            self.wait_ready()
+        try:
+            self.transport.writev(buffers)
+        except Exception as e:
+            self._ready_until = 0
+            if not is_timeout(e):
+                raise
+            # Find out why the printer stopped accepting data
+            status = self.query_status()
+            if not status.ready:
+                raise PrinterOfflineError("Printer not ready: %r" % status, status)
+            raise PrinterBusyError("Printer receive buffer full", status)
+
+    def read(self, size, timeout=None):
+        return self.transport.read(size, timeout)
+
+    def close(self):
+        self.transport.close()
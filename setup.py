@@ -49,11 +49,12 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
     ],
 
+    # str.isascii, asyncio.get_running_loop
+    python_requires='>=3.7',
+
     # What does your project relate to?
     keywords='epson printer escpos',
 
@@ -67,8 +68,8 @@ setup(
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=[
       'pyusb>=1.0.0',
-      'Pillow>=3.1.0',
-      'numpy>=1.11.0'
+      'Pillow>=8.0',
+      'numpy>=1.13'
     ]
 
 )